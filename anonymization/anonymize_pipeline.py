@@ -0,0 +1,132 @@
+import cv2
+import queue
+import threading
+from blur_engine import BlurEngine
+from video_writers import create_video_writer
+from write_bboxes import anonymize_frame
+from bbox_store import open_bbox_writer
+from yolo_tracking import load_model, load_tracker, track_frames, tracks_to_bboxes
+
+END_OF_STREAM = None
+QUEUE_TIMEOUT = 0.1 # seconds between checks of the stop event while a queue is full/empty
+
+def put_item(item_queue, item, stop_event):
+    """Puts an item on a bounded queue, giving up once the pipeline is stopping."""
+    while not stop_event.is_set():
+        try:
+            item_queue.put(item, timeout = QUEUE_TIMEOUT)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def iter_queue(item_queue, stop_event):
+    """Yields queue items until the end-of-stream marker arrives or the pipeline stops."""
+    while not stop_event.is_set():
+        try:
+            item = item_queue.get(timeout = QUEUE_TIMEOUT)
+        except queue.Empty:
+            continue
+        if item is END_OF_STREAM:
+            return
+        yield item
+
+def decode_stage(cap, frame_queue, stop_event, errors):
+    """Decodes frames into the bounded frame queue."""
+    try:
+        while cap.isOpened() and not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if not put_item(frame_queue, frame, stop_event):
+                return
+    except Exception as e:
+        errors.append(e)
+        stop_event.set()
+    finally:
+        put_item(frame_queue, END_OF_STREAM, stop_event)
+
+def write_stage(output, write_queue, stop_event, errors, blur_engine = None):
+    """Blurs and encodes each frame as soon as its boxes are known."""
+    try:
+        for frame, bboxes in iter_queue(write_queue, stop_event):
+            output.write(anonymize_frame(frame, bboxes, blur_engine))
+    except Exception as e:
+        errors.append(e)
+        stop_event.set()
+
+def main(model_path, video_path, output_path, bbox_path = None, batch_size = 8, queue_size = 64, blur_engine = None, writer_config = None, detect_every = 1):
+    """Decodes, tracks and anonymizes a video in one pass.
+
+    A decode thread fills a bounded frame queue, the detector/tracker consumes it
+    on the calling thread and a writer thread blurs and encodes every frame once
+    its boxes are known. If bbox_path is given the boxes are also written there,
+    as a binary bbox store or as text for .txt paths. detect_every > 1 runs the
+    detector on every detect_every-th frame only (see track_frames).
+    """
+    model = load_model(model_path)
+    tracker = load_tracker(detect_every = detect_every)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"ERROR: Cannot open video {video_path}.")
+        return
+
+    # GET VIDEO PROPERTIES
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    output = create_video_writer(output_path, fps, (frame_width, frame_height), **(writer_config or {}))
+
+    frame_queue = queue.Queue(maxsize = queue_size)
+    write_queue = queue.Queue(maxsize = queue_size)
+    stop_event = threading.Event()
+    errors = []
+
+    decoder = threading.Thread(target = decode_stage, args = (cap, frame_queue, stop_event, errors), daemon = True)
+    writer = threading.Thread(target = write_stage, args = (output, write_queue, stop_event, errors, blur_engine), daemon = True)
+    decoder.start()
+    writer.start()
+
+    bbox_writer = open_bbox_writer(bbox_path, fps = fps) if bbox_path else None
+    try:
+        frame_count = 0
+        frames = iter_queue(frame_queue, stop_event)
+
+        for frame_id, (frame, tracks) in enumerate(track_frames(model, tracker, frames, batch_size = batch_size, detect_every = detect_every)):
+            frame_count = frame_id + 1
+            bboxes = tracks_to_bboxes(tracks)
+
+            if bbox_writer:
+                bbox_writer.write(frame_id, bboxes)
+
+            if not put_item(write_queue, (frame, bboxes), stop_event):
+                break
+    except Exception as e:
+        errors.append(e)
+        stop_event.set()
+    finally:
+        put_item(write_queue, END_OF_STREAM, stop_event)
+        writer.join()
+        stop_event.set()
+        decoder.join()
+
+        # RELEASE RESOURCES
+        if bbox_writer:
+            bbox_writer.close()
+        cap.release()
+        output.release()
+
+    if errors:
+        print(f"ERROR: Anonymization pipeline failed. DETAILS: {errors[0]}")
+        return
+    print(f"Finished anonymizing {frame_count} frames")
+
+if __name__ == "__main__":
+    video_path = "path/file.mp4"
+    output_path = "./tracked_output.mp4"
+    bbox_path = "./btrack_bboxes.bin" # set to None to skip writing the boxes
+    model_path = "path/yolo11x.pt" # download the model: https://github.com/ultralytics/assets/releases/download/v8.3.0/yolo11x.pt
+
+    main(model_path, video_path, output_path, bbox_path = bbox_path, blur_engine = BlurEngine())
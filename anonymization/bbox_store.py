@@ -0,0 +1,460 @@
+import os
+import json
+import numpy as np
+
+# FIXED-WIDTH RECORD, ONE PER BOX
+BBOX_DTYPE = np.dtype([
+    ("frame_id", "<i4"),
+    ("x1", "<i4"),
+    ("y1", "<i4"),
+    ("x2", "<i4"),
+    ("y2", "<i4"),
+    ("class_id", "<i4"),
+    ("conf", "<f4"),
+    ("track_id", "<i4"),
+    ("interpolated", "u1"),
+])
+BBOX_FIELDS = ["x1", "y1", "x2", "y2", "class_id", "conf", "track_id", "interpolated"]
+
+MAGIC = b"WLPDBBOX"
+FORMAT_VERSION = 3 # version 3 adds the interpolated flag of boxes filled in between detections
+SUPPORTED_VERSIONS = (2, 3)
+HEADER_SIZE = 4096 # records start here, so the file can be memory-mapped with a fixed offset
+TEXT_EXTENSION = ".txt"
+
+# FRAME INDEXING: version 2 records the index base with the source video's frame
+# count and fps. Files without it come from the old tracker, which counted from 1.
+INDEX_BASE = 0
+LEGACY_INDEX_BASE = 1
+TEXT_HEADER_PREFIX = "# wlpd-bboxes"
+TEXT_HEADER_WIDTH = 127 # fixed width so the header can be rewritten in place on close
+FPS_TOLERANCE = 0.01
+
+def legacy_info():
+    return {"version": 1, "index_base": LEGACY_INDEX_BASE, "frame_count": None, "fps": None}
+
+def write_header(bbox_file, header):
+    """Writes the magic and the JSON header, padded to HEADER_SIZE."""
+    payload = MAGIC + json.dumps(header).encode("utf-8")
+    if len(payload) > HEADER_SIZE:
+        raise ValueError(f"Bbox store header is larger than {HEADER_SIZE} bytes.")
+
+    bbox_file.seek(0)
+    bbox_file.write(payload.ljust(HEADER_SIZE, b" "))
+
+def read_header(bbox_file):
+    """Reads and validates the header of a bbox store."""
+    raw = bbox_file.read(HEADER_SIZE)
+    if not raw.startswith(MAGIC):
+        raise ValueError("Not a bbox store file (bad magic).")
+
+    header = json.loads(raw[len(MAGIC):].decode("utf-8"))
+    if header.get("version") == 1:
+        header = {**legacy_info(), **header}
+    elif header.get("version") not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported bbox store version {header.get('version')}.")
+    return header
+
+def format_text_header(info):
+    line = f"{TEXT_HEADER_PREFIX} version={info['version']} index_base={info['index_base']} frame_count={info['frame_count']} fps={info['fps']}"
+    if len(line) > TEXT_HEADER_WIDTH:
+        raise ValueError(f"Bbox text header is longer than {TEXT_HEADER_WIDTH} characters.")
+    return line.ljust(TEXT_HEADER_WIDTH) + "\n"
+
+def parse_text_header(line):
+    """Parses the text header line, or returns None if the line is not one."""
+    if not line.startswith(TEXT_HEADER_PREFIX):
+        return None
+
+    fields = dict(token.split("=", 1) for token in line[len(TEXT_HEADER_PREFIX):].split())
+    return {
+        "version": int(fields["version"]),
+        "index_base": int(fields["index_base"]),
+        "frame_count": int(fields["frame_count"]) if fields.get("frame_count", "None") != "None" else None,
+        "fps": float(fields["fps"]) if fields.get("fps", "None") != "None" else None,
+    }
+
+def read_bbox_info(path):
+    """Returns the version, index_base, frame_count and fps recorded in a bbox file."""
+    if is_text_path(path):
+        with open(path, 'r') as bbox_file:
+            return parse_text_header(bbox_file.readline()) or legacy_info()
+
+    with open(path, 'rb') as bbox_file:
+        header = read_header(bbox_file)
+    return {key: header[key] for key in ("version", "index_base", "frame_count", "fps")}
+
+def check_video_info(info, frame_count, fps):
+    """Compares a bbox file's frame info with the opened video, returning (problems, warnings).
+
+    An unknown index base or another fps is a problem. frame_count usually
+    comes from CAP_PROP_FRAME_COUNT, which is only an estimate from the
+    container (VFR videos, wrong headers), so a different count is a warning.
+    """
+    problems, warnings = [], []
+    if info["index_base"] not in (INDEX_BASE, LEGACY_INDEX_BASE):
+        problems.append(f"bbox file counts frames from {info['index_base']}, expected {INDEX_BASE} or {LEGACY_INDEX_BASE}")
+    if info["fps"] is not None and abs(info["fps"] - fps) > FPS_TOLERANCE:
+        problems.append(f"bbox file was made at {info['fps']} fps, the video runs at {fps}")
+    if info["frame_count"] is not None and info["frame_count"] != frame_count:
+        warnings.append(f"bbox file was made from {info['frame_count']} frames, the video reports {frame_count}")
+    return problems, warnings
+
+def upgrade_records(records):
+    """Copies records of an older dtype into BBOX_DTYPE, missing fields stay zero."""
+    upgraded = np.zeros(len(records), dtype = BBOX_DTYPE)
+    for field in records.dtype.names:
+        upgraded[field] = records[field]
+    return upgraded
+
+def bboxes_to_records(frame_id, bboxes):
+    """Packs (x1, y1, x2, y2, class_id, confidence, object_id[, interpolated]) tuples of one frame into records."""
+    records = np.zeros(len(bboxes), dtype = BBOX_DTYPE)
+    records["frame_id"] = frame_id
+    for field, column in zip(BBOX_FIELDS, zip(*bboxes)):
+        records[field] = column
+    return records
+
+class BboxStoreWriter:
+    """Streams detections into a binary bbox store.
+
+    write() is called once per decoded frame, empty frames included, with
+    0-based frame ids, so the header records the number of frames seen.
+    Passing the dict returned by checkpoint() as resume reopens the file, drops
+    anything written after that checkpoint and continues appending.
+    """
+
+    def __init__(self, path, fps = None, resume = None):
+        self.path = path
+        self.fps = fps
+        self.num_records = 0
+        self.frame_count = 0
+        if resume is None:
+            self.file = open(path, 'wb')
+            write_header(self.file, self.header())
+        else:
+            self.file = open(path, 'r+b')
+            self.num_records, self.frame_count = resume["num_records"], resume["frame_count"]
+            self.file.seek(resume["offset"])
+            self.file.truncate()
+
+    def header(self):
+        return {
+            "version": FORMAT_VERSION, "dtype": BBOX_DTYPE.descr, "num_records": self.num_records,
+            "index_base": INDEX_BASE, "frame_count": self.frame_count, "fps": self.fps
+        }
+
+    def write(self, frame_id, bboxes):
+        self.frame_count = max(self.frame_count, frame_id - INDEX_BASE + 1)
+        if not bboxes:
+            return
+        bboxes_to_records(frame_id, bboxes).tofile(self.file)
+        self.num_records += len(bboxes)
+
+    def checkpoint(self):
+        """Updates the header, flushes everything to disk and returns the position to resume from."""
+        write_header(self.file, self.header())
+        self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {"offset": self.file.tell(), "num_records": self.num_records, "frame_count": self.frame_count}
+
+    def close(self):
+        if self.file.closed:
+            return
+        write_header(self.file, self.header())
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class TextBboxWriter:
+    """Writes detections in the ", "-separated text format behind a header line."""
+
+    def __init__(self, path, fps = None, resume = None):
+        self.path = path
+        self.fps = fps
+        self.frame_count = 0
+        if resume is None:
+            self.file = open(path, 'w')
+            self.file.write(format_text_header(self.info()))
+        else:
+            self.file = open(path, 'r+')
+            self.frame_count = resume["frame_count"]
+            self.file.seek(resume["offset"])
+            self.file.truncate()
+
+    def info(self):
+        return {"version": FORMAT_VERSION, "index_base": INDEX_BASE, "frame_count": self.frame_count, "fps": self.fps}
+
+    def write(self, frame_id, bboxes):
+        self.frame_count = max(self.frame_count, frame_id - INDEX_BASE + 1)
+        for x1, y1, x2, y2, class_id, confidence, object_id, *interpolated in bboxes:
+            interpolated = int(interpolated[0]) if interpolated else 0
+            self.file.write(f"{frame_id}, {x1}, {y1}, {x2}, {y2}, {class_id}, {confidence:.4f}, {object_id}, {interpolated}\n")
+
+    def checkpoint(self):
+        """Updates the header line, flushes everything to disk and returns the position to resume from."""
+        self.file.seek(0)
+        self.file.write(format_text_header(self.info()))
+        self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {"offset": self.file.tell(), "frame_count": self.frame_count}
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.seek(0)
+        self.file.write(format_text_header(self.info()))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class BboxStore:
+    """Memory-mapped reader of a bbox store with a frame -> row-range index.
+
+    Supports `frame_id in store` and `store[frame_id]`, which returns the boxes of
+    that frame as (x1, y1, x2, y2, class_id, confidence, object_id, interpolated)
+    tuples, so it can be used in place of the dict read from the text format.
+    Frame ids are 0-based decode indices whatever index base the file was written
+    with. Version 2 files are read with interpolated = 0.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as bbox_file:
+            self.header = read_header(bbox_file)
+        self.index_base = self.header["index_base"]
+
+        num_records = self.header["num_records"]
+        dtype = np.dtype([tuple(field) for field in self.header["dtype"]])
+        if num_records:
+            self.records = np.memmap(path, dtype = dtype, mode = 'r', offset = HEADER_SIZE, shape = (num_records,))
+        else:
+            self.records = np.empty(0, dtype = dtype)
+        if dtype != BBOX_DTYPE:
+            self.records = upgrade_records(self.records)
+
+        frame_ids = self.records["frame_id"]
+        if np.any(np.diff(frame_ids) < 0):
+            # UNSORTED INPUT, ORDER THE RECORDS IN MEMORY BY FRAME
+            self.records = self.records[np.argsort(frame_ids, kind = "stable")]
+            frame_ids = self.records["frame_id"]
+
+        # FRAME -> [start, end) ROW RANGE
+        self.index_frames, self.index_starts = np.unique(frame_ids, return_index = True)
+        self.index_frames = self.index_frames - self.index_base
+        self.index_ends = np.append(self.index_starts[1:], len(self.records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def frame_ids(self):
+        return self.index_frames
+
+    def row_range(self, frame_id):
+        """Returns the [start, end) rows of a frame, or None if it has no boxes."""
+        pos = np.searchsorted(self.index_frames, frame_id)
+        if pos < len(self.index_frames) and self.index_frames[pos] == frame_id:
+            return int(self.index_starts[pos]), int(self.index_ends[pos])
+        return None
+
+    def rows(self, frame_id):
+        """Returns the records of a frame as a structured array."""
+        row_range = self.row_range(frame_id)
+        if row_range is None:
+            return self.records[:0]
+        start, end = row_range
+        return self.records[start:end]
+
+    def __contains__(self, frame_id):
+        return self.row_range(frame_id) is not None
+
+    def __getitem__(self, frame_id):
+        rows = self.rows(frame_id)
+        if len(rows) == 0:
+            raise KeyError(frame_id)
+        return rows[BBOX_FIELDS].tolist()
+
+    def get(self, frame_id, default = None):
+        rows = self.rows(frame_id)
+        return rows[BBOX_FIELDS].tolist() if len(rows) else default
+
+    def iter_frames(self):
+        """Yields (frame_id, boxes) per frame in increasing frame order."""
+        for frame_id, start, end in zip(self.index_frames.tolist(), self.index_starts.tolist(), self.index_ends.tolist()):
+            yield frame_id, self.records[start:end][BBOX_FIELDS].tolist()
+
+class BboxStream:
+    """Hands out each frame's boxes in step with a sequential decode loop.
+
+    Wraps (frame_id, boxes) groups sorted by frame and only keeps the next group
+    in memory. get() must be called with non-decreasing frame ids, like the dict
+    and BboxStore lookups it replaces.
+    """
+
+    def __init__(self, groups):
+        self.groups = iter(groups)
+        self.pending = next(self.groups, None)
+
+    def get(self, frame_id, default = None):
+        while self.pending is not None and self.pending[0] < frame_id:
+            self.pending = next(self.groups, None)
+
+        if self.pending is not None and self.pending[0] == frame_id:
+            return self.pending[1]
+        return default
+
+def parse_bbox_line(line):
+    """Parses one text line into (frame_id, box tuple), lines without the interpolated column read as 0."""
+    fields = line.strip().split(', ')
+    frm_id, x_min, y_min, x_max, y_max, class_id, conf, obj_id = fields[:8]
+    interpolated = int(fields[8]) if len(fields) > 8 else 0
+
+    # CONVERTING
+    frame_id = int(frm_id)
+    x1, y1, x2, y2 = map(int, [x_min, y_min, x_max, y_max])
+    confidence = float(conf)
+    object_id = int(obj_id) if obj_id != 'N/A' else None
+    return frame_id, (x1, y1, x2, y2, class_id, confidence, object_id, interpolated)
+
+def read_bbox_text(path):
+    """Reads the text format into a dict of 0-based frame_id -> list of box tuples."""
+    bbox_values = {}
+    with open(path, 'r') as bbox_file:
+        info = parse_text_header(bbox_file.readline()) or legacy_info()
+        bbox_file.seek(0)
+
+        for line in bbox_file:
+            if line.startswith("#"):
+                continue
+            frame_id, bbox = parse_bbox_line(line)
+            frame_id -= info["index_base"]
+
+            if frame_id not in bbox_values:
+                bbox_values[frame_id] = []
+            bbox_values[frame_id].append(bbox)
+    return bbox_values
+
+def iter_text_groups(bbox_file):
+    """Yields (0-based frame_id, boxes) from an open text file, one frame at a time."""
+    with bbox_file:
+        frame_boxes = []
+        current_frame = None
+        info = parse_text_header(bbox_file.readline()) or legacy_info()
+        bbox_file.seek(0)
+
+        for line in bbox_file:
+            if line.startswith("#"):
+                continue
+            frame_id, bbox = parse_bbox_line(line)
+            frame_id -= info["index_base"]
+            if frame_id != current_frame:
+                if current_frame is not None:
+                    if frame_id < current_frame:
+                        raise ValueError(f"Bbox file is not sorted by frame ({frame_id} after {current_frame}), read it with streaming = False.")
+                    yield current_frame, frame_boxes
+                current_frame, frame_boxes = frame_id, []
+            frame_boxes.append(bbox)
+
+        if current_frame is not None:
+            yield current_frame, frame_boxes
+
+def iter_bbox_groups(path):
+    """Streams (frame_id, boxes) groups of either format in increasing frame order.
+
+    The file is opened right away, so a missing file fails here rather than on
+    the first frame.
+    """
+    if is_text_path(path):
+        return iter_text_groups(open(path, 'r'))
+    return BboxStore(path).iter_frames()
+
+def is_sorted_by_frame(path):
+    """Returns whether the boxes can be streamed in frame order.
+
+    Binary stores are sorted when they are opened. Text files are checked by
+    their frame id column, old tracker output is not always sorted.
+    """
+    if not is_text_path(path):
+        return True
+
+    previous = None
+    with open(path, 'r') as bbox_file:
+        for line in bbox_file:
+            if line.startswith("#"):
+                continue
+            frame_id = int(line.split(',', 1)[0])
+            if previous is not None and frame_id < previous:
+                return False
+            previous = frame_id
+    return True
+
+def is_text_path(path):
+    return str(path).lower().endswith(TEXT_EXTENSION)
+
+def open_bbox_writer(path, fps = None, resume = None):
+    """Opens a text writer for .txt paths and a binary store writer otherwise."""
+    return TextBboxWriter(path, fps, resume) if is_text_path(path) else BboxStoreWriter(path, fps, resume)
+
+def load_bboxes(path):
+    """Loads boxes from either format, indexable by frame_id."""
+    return read_bbox_text(path) if is_text_path(path) else BboxStore(path)
+
+def check_bbox_file(bbox_path, frame_count, fps):
+    """Checks the index base, fps and frame count recorded in the bbox file against the video.
+
+    Only a frame count mismatch is allowed through, with a warning, as the
+    video's count is an estimate from the container.
+    """
+    info = read_bbox_info(bbox_path)
+    if info["version"] < 2:
+        print(f"WARNING: {bbox_path} has no frame info, assuming the old 1-based frame ids.")
+
+    problems, warnings = check_video_info(info, frame_count, fps)
+    for warning in warnings:
+        print(f"WARNING: {bbox_path} may not match the video: {warning} (container estimate).")
+    for problem in problems:
+        print(f"ERROR: {bbox_path} does not match the video: {problem}.")
+    return not problems
+
+def open_bboxes_checked(bbox_path, frame_count, fps, check_header = True, streaming = True):
+    """Opens a bbox file for a video, printing the reason and returning None if it cannot be used.
+
+    Unless check_header is False the file's frame info is checked against the
+    video's frame_count and fps. With streaming the boxes come as a BboxStream,
+    otherwise (or for an unsorted text file) they are loaded whole with load_bboxes.
+    """
+    try:
+        if check_header and not check_bbox_file(bbox_path, frame_count, fps):
+            return None
+
+        # CHECKED BEFORE ANY OUTPUT IS OPENED, AN UNSORTED FILE WOULD ONLY FAIL PARTWAY THROUGH DECODING
+        if streaming and not is_sorted_by_frame(bbox_path):
+            print(f"WARNING: {bbox_path} is not sorted by frame, loading it whole instead of streaming.")
+            streaming = False
+
+        return BboxStream(iter_bbox_groups(bbox_path)) if streaming else load_bboxes(bbox_path)
+    except FileNotFoundError:
+        print(f"ERROR: The file {bbox_path} does not exist.")
+    except IOError as io_err:
+        print(f"ERROR: Cannot read file {bbox_path}. DETAILS: {io_err}")
+    except Exception as e:
+        print(f"ERROR: {e}")
+    return None
+
+def export_text(store_path, text_path):
+    """Exports a binary bbox store to the text format."""
+    store = BboxStore(store_path)
+    with TextBboxWriter(text_path, store.header["fps"]) as text_writer:
+        for frame_id, bboxes in store.iter_frames():
+            text_writer.write(frame_id, bboxes)
+        text_writer.frame_count = store.header["frame_count"] or text_writer.frame_count
@@ -0,0 +1,148 @@
+import cv2
+import numpy as np
+
+BLUR_KERNELS = ("box", "gaussian", "pixelate")
+HEAD_RATIO = 0.2 # top share of the person box that is blurred
+MIN_HEAD_HEIGHT = 25 # 25 is the min crop height
+MAX_MERGE_GROWTH = 1.5 # merged roi may cover at most this much more area than its boxes
+
+def head_region(x1, y1, x2, y2):
+    """Returns the head crop (top of the person box) of a bbox."""
+    crop_height = max(int((y2 - y1) * HEAD_RATIO), MIN_HEAD_HEIGHT)
+    return x1, y1, x2, y1 + crop_height
+
+def merge_regions(regions):
+    """Groups overlapping regions and returns (roi, member_regions) per group.
+
+    Overlap is tested for all pairs at once with numpy, groups are the connected
+    components of the overlap graph and each roi is the bounding box of its group.
+    Groups whose roi would grow past MAX_MERGE_GROWTH times the area of their
+    boxes are returned box by box instead.
+    """
+    if len(regions) == 0:
+        return []
+
+    rects = np.asarray(regions)
+    x1, y1, x2, y2 = rects[:, 0], rects[:, 1], rects[:, 2], rects[:, 3]
+    overlaps = (
+        (x1[:, None] < x2[None, :]) & (x1[None, :] < x2[:, None]) &
+        (y1[:, None] < y2[None, :]) & (y1[None, :] < y2[:, None])
+    )
+
+    # CONNECTED COMPONENTS BY LABEL PROPAGATION
+    labels = np.arange(len(rects))
+    while True:
+        new_labels = np.where(overlaps, labels[None, :], len(rects)).min(axis = 1)
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    # PER-GROUP ROI AND AREA WITH SEGMENTED REDUCTIONS
+    order = np.argsort(labels, kind = "stable")
+    rects, labels = rects[order], labels[order]
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    rois = np.stack([
+        np.minimum.reduceat(rects[:, 0], starts), np.minimum.reduceat(rects[:, 1], starts),
+        np.maximum.reduceat(rects[:, 2], starts), np.maximum.reduceat(rects[:, 3], starts)
+    ], axis = 1)
+    roi_areas = (rois[:, 2] - rois[:, 0]) * (rois[:, 3] - rois[:, 1])
+    box_areas = np.add.reduceat((rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1]), starts)
+
+    groups = []
+    for roi, roi_area, box_area, members in zip(rois.tolist(), roi_areas, box_areas, np.split(rects, starts[1:])):
+        # A LOOSE CHAIN OF BOXES WOULD BLUR MUCH MORE THAN IT COVERS, KEEP THOSE SEPARATE
+        if len(members) > 1 and roi_area > MAX_MERGE_GROWTH * box_area:
+            groups.extend((tuple(member), [member]) for member in members.tolist())
+        else:
+            groups.append((tuple(roi), members))
+    return groups
+
+class BlurEngine:
+    """Blurs head regions once per merged ROI instead of once per box.
+
+    kernel is "box" (cv2.blur), "gaussian" (cv2.GaussianBlur) or "pixelate"
+    (downscale to pixel_size blocks and upscale with nearest neighbour). Frames
+    with more than dense_threshold regions blur the span covering all regions in a
+    single call and copy the regions out of it, so the cost stops growing with the
+    number of boxes. With draw_debug the box and ID label are drawn after blurring,
+    so they stay visible and are not blurred into the region.
+    """
+
+    def __init__(self, kernel = "box", ksize = 40, pixel_size = 16, draw_debug = True, dense_threshold = 16):
+        if kernel not in BLUR_KERNELS:
+            raise ValueError(f"Unknown blur kernel '{kernel}', expected one of {BLUR_KERNELS}.")
+        self.kernel = kernel
+        self.ksize = ksize
+        self.pixel_size = pixel_size
+        self.draw_debug = draw_debug
+        self.dense_threshold = dense_threshold
+
+    def blur(self, roi):
+        if self.kernel == "box":
+            return cv2.blur(roi, (self.ksize, self.ksize))
+        if self.kernel == "gaussian":
+            ksize = self.ksize | 1 # GaussianBlur needs an odd kernel
+            return cv2.GaussianBlur(roi, (ksize, ksize), 0)
+
+        height, width = roi.shape[:2]
+        small = cv2.resize(roi, (max(1, width // self.pixel_size), max(1, height // self.pixel_size)), interpolation = cv2.INTER_LINEAR)
+        return cv2.resize(small, (width, height), interpolation = cv2.INTER_NEAREST)
+
+    def head_regions(self, frame, bboxes):
+        """Returns the head regions of all bboxes as an (N, 4) array clipped to the frame."""
+        if len(bboxes) == 0:
+            return np.empty((0, 4), dtype = int)
+
+        frame_height, frame_width = frame.shape[:2]
+        boxes = np.array([bbox[:4] for bbox in bboxes], dtype = int)
+        heights = np.maximum((boxes[:, 3] - boxes[:, 1]) * HEAD_RATIO, MIN_HEAD_HEIGHT).astype(int)
+        boxes[:, 3] = boxes[:, 1] + heights
+
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, frame_width)
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, frame_height)
+        return boxes[(boxes[:, 0] < boxes[:, 2]) & (boxes[:, 1] < boxes[:, 3])]
+
+    def anonymize(self, frame, bboxes):
+        """Blurs the head regions of all bboxes in the frame in place."""
+        regions = self.head_regions(frame, bboxes)
+
+        if len(regions) > self.dense_threshold:
+            self.blur_span(frame, regions)
+        else:
+            for (rx1, ry1, rx2, ry2), members in merge_regions(regions):
+                roi = frame[ry1:ry2, rx1:rx2]
+                blurred = self.blur(roi)
+
+                if len(members) == 1:
+                    roi[:] = blurred
+                    continue
+
+                # ONLY COPY BACK THE PIXELS COVERED BY THE MEMBER BOXES
+                mask = np.zeros(roi.shape[:2], dtype = bool)
+                for mx1, my1, mx2, my2 in members:
+                    mask[my1 - ry1:my2 - ry1, mx1 - rx1:mx2 - rx1] = True
+                np.copyto(roi, blurred, where = mask[:, :, None])
+
+        if self.draw_debug:
+            self.draw_labels(frame, bboxes)
+        return frame
+
+    def blur_span(self, frame, regions):
+        """Blurs the span covering all regions once and copies each region out of it."""
+        sx1, sy1 = regions[:, :2].min(axis = 0)
+        sx2, sy2 = regions[:, 2:].max(axis = 0)
+        span = frame[sy1:sy2, sx1:sx2]
+        blurred = self.blur(span)
+
+        for x1, y1, x2, y2 in (regions - [sx1, sy1, sx1, sy1]).tolist():
+            span[y1:y2, x1:x2] = blurred[y1:y2, x1:x2]
+
+    def draw_labels(self, frame, bboxes):
+        for x1, y1, x2, y2, class_id, confidence, object_id, *interpolated in bboxes:
+            x1, y1, x2, y2 = head_region(x1, y1, x2, y2)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            label = f"ID: {object_id}" if object_id is not None else "ID: N/A"
+            if interpolated and interpolated[0]:
+                label += " (interp)"
+            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
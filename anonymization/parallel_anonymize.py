@@ -0,0 +1,213 @@
+import os
+import cv2
+import time
+import bisect
+import shutil
+import tempfile
+import subprocess
+from bbox_store import BboxStore, load_bboxes, open_bboxes_checked
+from blur_engine import BlurEngine
+from video_writers import create_video_writer
+from concurrent.futures import ProcessPoolExecutor
+from write_bboxes import anonymize_frame, main as serial_main
+
+def probe_keyframes(video_path):
+    """Returns the display-order indices of the keyframes, or None if ffprobe is unavailable."""
+    if shutil.which("ffprobe") is None:
+        return None
+
+    command = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=pts,flags", "-of", "csv=p=0", video_path
+    ]
+    result = subprocess.run(command, capture_output = True, text = True)
+    if result.returncode != 0:
+        print(f"WARNING: ffprobe failed on {video_path}, falling back to even segments. DETAILS: {result.stderr.strip()}")
+        return None
+
+    packets = []
+    for line in result.stdout.splitlines():
+        pts, flags = (line.split(",") + [""])[:2]
+        if pts not in ("", "N/A"):
+            packets.append((int(pts), "K" in flags))
+
+    # PACKETS COME IN DECODE ORDER, SORTING BY PTS GIVES THE DISPLAY INDEX
+    packets.sort()
+    return [idx for idx, (_, is_key) in enumerate(packets) if is_key]
+
+def plan_segments(total_frames, num_segments, keyframes = None):
+    """Splits the video into about num_segments (start, end) ranges, cutting at keyframes when known.
+
+    total_frames is the container's estimate, so it only places the cuts: the
+    last range has end None and is read until the video ends, like the serial path.
+    """
+    if total_frames <= 0:
+        return [(0, None)]
+    num_segments = max(1, min(num_segments, total_frames))
+    targets = [round(total_frames * i / num_segments) for i in range(1, num_segments)]
+
+    if keyframes:
+        cuts = sorted({min(keyframes, key = lambda k: abs(k - target)) for target in targets})
+    else:
+        cuts = sorted(set(targets))
+
+    bounds = [0] + [cut for cut in cuts if 0 < cut < total_frames]
+    return list(zip(bounds, bounds[1:] + [None]))
+
+def split_bboxes(bbox_values, segments):
+    """Returns the boxes each segment's worker reads, see anonymize_segment.
+
+    bbox_values comes from load_bboxes in the parent. A text file was parsed
+    there and every worker gets a dict of its own frames. A binary store is
+    memory-mapped, so its path is handed over and the workers only touch their own rows.
+    """
+    if isinstance(bbox_values, BboxStore):
+        return [bbox_values.path] * len(segments)
+
+    starts = [start for start, _ in segments]
+    parts = [{} for _ in segments]
+    for frame_id, bboxes in bbox_values.items():
+        i = bisect.bisect_right(starts, frame_id) - 1
+        if i >= 0 and (segments[i][1] is None or frame_id < segments[i][1]):
+            parts[i][frame_id] = bboxes
+    return parts
+
+def anonymize_segment(video_path, segment_path, bboxes, start, end, blur_engine = None, writer_config = None):
+    """Decodes, blurs and encodes the frames [start, end) into their own file, returning the number written.
+
+    With end None the frames are read until the video ends. bboxes is a bbox
+    store path or a dict of frame_id -> boxes (see split_bboxes).
+    """
+    cv2.setNumThreads(1) # one worker per core, avoid oversubscribing the pool
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {video_path}.")
+
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    output = create_video_writer(segment_path, fps, (frame_width, frame_height), **(writer_config or {}))
+    bbox_values = load_bboxes(bboxes) if isinstance(bboxes, str) else bboxes
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+        cap.release()
+        output.release()
+        raise IOError(f"Cannot seek {video_path} to frame {start}.")
+
+    frame_idx = start
+    while end is None or frame_idx < end:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        if frame_idx in bbox_values:
+            frame = anonymize_frame(frame, bbox_values[frame_idx], blur_engine)
+
+        output.write(frame)
+        frame_idx += 1
+
+    # RELEASE RESOURCES
+    cap.release()
+    output.release()
+    return frame_idx - start
+
+def concat_segments(segment_paths, output_path):
+    """Joins the segment files without re-encoding using ffmpeg's concat demuxer."""
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is required to join the segments losslessly.")
+
+    list_path = f"{output_path}.segments.txt"
+    with open(list_path, 'w') as list_file:
+        for segment_path in segment_paths:
+            list_file.write(f"file '{os.path.abspath(segment_path)}'\n")
+
+    command = ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", output_path]
+    try:
+        subprocess.run(command, check = True)
+    finally:
+        os.remove(list_path)
+
+def main(video_path, output_path, bbox_path, num_workers = 1, blur_engine = None, check_header = True, writer_config = None):
+    """Anonymizes a video in keyframe-aligned segments across num_workers processes.
+
+    The speedup has not been measured on a multi-core host yet, so the default
+    of one worker runs the serial write_bboxes path. Pass num_workers = None to
+    use every core.
+    """
+    num_workers = num_workers or os.cpu_count()
+    if num_workers <= 1:
+        return serial_main(video_path, output_path, bbox_path, blur_engine, check_header = check_header, writer_config = writer_config)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"ERROR: Cannot open video {video_path}.")
+        return
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+
+    bbox_values = open_bboxes_checked(bbox_path, total_frames, fps, check_header, streaming = False)
+    if bbox_values is None:
+        return
+
+    segments = plan_segments(total_frames, num_workers, probe_keyframes(video_path))
+    segment_dir = tempfile.mkdtemp(prefix = "anonymize_segments_", dir = os.path.dirname(os.path.abspath(output_path)))
+    # SEGMENTS USE THE OUTPUT'S CONTAINER SO THE CONCAT DEMUXER CAN COPY THEM INTO IT
+    extension = os.path.splitext(output_path)[1] or ".mp4"
+    segment_paths = [os.path.join(segment_dir, f"segment_{i:04d}{extension}") for i in range(len(segments))]
+
+    try:
+        with ProcessPoolExecutor(max_workers = num_workers) as pool:
+            jobs = [
+                pool.submit(anonymize_segment, video_path, segment_path, bboxes, start, end, blur_engine, writer_config)
+                for segment_path, bboxes, (start, end) in zip(segment_paths, split_bboxes(bbox_values, segments), segments)
+            ]
+            counts = [job.result() for job in jobs]
+
+        # EVERY SEGMENT BUT THE LAST MUST BE COMPLETE, OR THE OUTPUT WOULD NOT MATCH THE SERIAL PATH
+        for (start, end), count in zip(segments, counts):
+            if end is not None and count != end - start:
+                raise RuntimeError(f"segment [{start}, {end}) wrote {count} frames instead of {end - start}")
+        written = sum(counts)
+
+        concat_segments(segment_paths, output_path)
+    except Exception as e:
+        print(f"ERROR: Parallel anonymization failed. DETAILS: {e}")
+        return
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors = True)
+
+    if written != total_frames:
+        print(f"WARNING: Wrote {written} frames, the container reports {total_frames}.")
+    print(f"Finished writing {written} frames in {len(segments)} segments")
+
+def benchmark_scaling(video_path, bbox_path, worker_counts = (2, 4, 8), output_dir = ".", blur_engine = None, writer_config = None):
+    """Times the serial path and the parallel path for each worker count and prints the speedup."""
+    cap = cv2.VideoCapture(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    start_time = time.perf_counter()
+    serial_main(video_path, os.path.join(output_dir, "benchmark_serial.mp4"), bbox_path, blur_engine, writer_config = writer_config)
+    serial_time = time.perf_counter() - start_time
+
+    rows = [("serial", serial_time)]
+    for num_workers in worker_counts:
+        start_time = time.perf_counter()
+        main(video_path, os.path.join(output_dir, f"benchmark_parallel_{num_workers}.mp4"), bbox_path, num_workers = num_workers, blur_engine = blur_engine, writer_config = writer_config)
+        rows.append((f"{num_workers} workers", time.perf_counter() - start_time))
+
+    print(f"{'mode':<12} {'seconds':>9} {'fps':>9} {'speedup':>8}")
+    for name, seconds in rows:
+        print(f"{name:<12} {seconds:>9.2f} {total_frames / seconds:>9.1f} {serial_time / seconds:>7.2f}x")
+    return rows
+
+if __name__ == "__main__":
+    bbox_path = "./btrack_bboxes.bin"
+    video_path = "path/file.mp4"
+    output_path = "./tracked_output.mp4"
+
+    main(video_path, output_path, bbox_path, blur_engine = BlurEngine())
@@ -0,0 +1,122 @@
+import os
+import cv2
+import time
+import shutil
+import subprocess
+
+class OpenCVVideoWriter:
+    """cv2.VideoWriter with a configurable codec, quality and encoder stripes."""
+
+    def __init__(self, path, fps, frame_size, codec = "mp4v", quality = None, threads = None):
+        params = []
+        if quality is not None:
+            params += [cv2.VIDEOWRITER_PROP_QUALITY, int(quality)]
+        if threads is not None:
+            params += [cv2.VIDEOWRITER_PROP_NSTRIPES, int(threads)]
+
+        self.writer = cv2.VideoWriter(path, cv2.CAP_ANY, cv2.VideoWriter_fourcc(*codec), fps, frame_size, params)
+        if not self.writer.isOpened():
+            raise IOError(f"OpenCV cannot open a '{codec}' writer for {path}.")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+class FFmpegVideoWriter:
+    """Pipes raw BGR frames into an ffmpeg process, e.g. for libx264/libx265 presets."""
+
+    def __init__(self, path, fps, frame_size, codec = "libx264", preset = "veryfast", crf = 23, threads = 0, pix_fmt = "yuv420p"):
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError("The ffmpeg backend needs an ffmpeg executable on PATH.")
+
+        width, height = frame_size
+        command = [
+            "ffmpeg", "-y", "-v", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+            "-c:v", codec, "-preset", preset, "-crf", str(crf), "-threads", str(threads), "-pix_fmt", pix_fmt,
+        ]
+        if codec == "libx265":
+            command += ["-x265-params", "log-level=error"]
+        command.append(path)
+        self.path = path
+        self.process = subprocess.Popen(command, stdin = subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(frame.tobytes())
+
+    def release(self):
+        if self.process.stdin.closed:
+            return
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise IOError(f"ffmpeg exited with code {self.process.returncode} while writing {self.path}.")
+
+VIDEO_WRITER_BACKENDS = {
+    "opencv": OpenCVVideoWriter,
+    "ffmpeg": FFmpegVideoWriter,
+}
+
+def create_video_writer(path, fps, frame_size, backend = "opencv", **options):
+    """Creates an output writer; options go to the backend (codec, quality, preset, crf, threads...)."""
+    if backend not in VIDEO_WRITER_BACKENDS:
+        raise ValueError(f"Unknown video writer backend '{backend}', expected one of {list(VIDEO_WRITER_BACKENDS)}.")
+    return VIDEO_WRITER_BACKENDS[backend](path, fps, frame_size, **options)
+
+DEFAULT_BENCHMARK_CONFIGS = [
+    {"backend": "opencv", "codec": "mp4v"},
+    {"backend": "opencv", "codec": "MJPG", "quality": 90},
+    {"backend": "ffmpeg", "codec": "libx264", "preset": "ultrafast"},
+    {"backend": "ffmpeg", "codec": "libx264", "preset": "veryfast"},
+    {"backend": "ffmpeg", "codec": "libx265", "preset": "fast"},
+]
+
+def benchmark_encoders(reference_clip, configs = None, output_dir = ".", max_frames = 300):
+    """Encodes the first max_frames of a reference clip with each writer config and prints encode fps and size."""
+    cap = cv2.VideoCapture(reference_clip)
+    if not cap.isOpened():
+        print(f"ERROR: Cannot open video {reference_clip}.")
+        return []
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+
+    if not frames:
+        print(f"ERROR: No frames decoded from {reference_clip}.")
+        return []
+    frame_size = (frames[0].shape[1], frames[0].shape[0])
+
+    rows = []
+    for i, config in enumerate(configs or DEFAULT_BENCHMARK_CONFIGS):
+        name = ", ".join(f"{key}={value}" for key, value in config.items())
+        extension = ".avi" if config.get("codec") == "MJPG" else ".mp4"
+        output_path = os.path.join(output_dir, f"encoder_benchmark_{i}{extension}")
+
+        try:
+            start_time = time.perf_counter()
+            writer = create_video_writer(output_path, fps, frame_size, **config)
+            for frame in frames:
+                writer.write(frame)
+            writer.release()
+            elapsed = time.perf_counter() - start_time
+        except (IOError, RuntimeError) as e:
+            print(f"WARNING: Skipping [{name}]. DETAILS: {e}")
+            continue
+
+        rows.append((name, len(frames) / elapsed, os.path.getsize(output_path) / 1024 ** 2))
+
+    for name, encode_fps, size_mb in rows:
+        print(f"{encode_fps:>8.1f} fps {size_mb:>8.2f} MB  {name}")
+    return rows
+
+if __name__ == "__main__":
+    reference_clip = "path/file.mp4"
+
+    benchmark_encoders(reference_clip)
@@ -1,4 +1,8 @@
+import os
 import cv2
+from bbox_store import open_bboxes_checked
+from blur_engine import BlurEngine, head_region
+from video_writers import create_video_writer
 
 def anonymize_region(frame, x1, y1, x2, y2, object_id):
     cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
@@ -11,7 +15,31 @@ def anonymize_region(frame, x1, y1, x2, y2, object_id):
     
     return frame
 
-def main(video_path, output_path, bbox_path):
+def anonymize_frame(frame, bboxes, blur_engine = None):
+    """Blurs the head region (top of the person box) of every bbox in the frame.
+
+    Without a blur_engine every box is blurred on its own with anonymize_region.
+    """
+    if blur_engine is not None:
+        return blur_engine.anonymize(frame, bboxes)
+
+    for bbox in bboxes:
+        x1, y1, x2, y2, class_id, confidence, object_id = bbox[:7]
+        x1, y1, x2, y2 = head_region(x1, y1, x2, y2)
+        frame = anonymize_region(frame, x1, y1, x2, y2, object_id)
+    return frame
+
+def main(video_path, output_path, bbox_path, blur_engine = None, streaming = True, check_header = True, writer_config = None):
+    """Blurs the tracked heads in the video.
+
+    With streaming the boxes are read frame by frame alongside the decode loop,
+    which needs a bbox file sorted by frame (as yolo_tracking writes it); an
+    unsorted text file is loaded whole instead. Set streaming = False to always
+    load the whole file for random access. Unless
+    check_header is False, the index base and fps in the bbox file must match
+    the video, a different frame count only warns. writer_config selects the output writer (see video_writers), the
+    default is OpenCV's mp4v writer.
+    """
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"ERROR: Cannot open video {video_path}.")
@@ -21,56 +49,34 @@ def main(video_path, output_path, bbox_path):
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = cap.get(cv2.CAP_PROP_FPS)
-    
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    output = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
-
-    bbox_values = {}
-    try:
-        with open(bbox_path, 'r') as bbox_file:
-            for line in bbox_file:
-                frm_id, x_min, y_min, x_max, y_max, class_id, conf, obj_id = line.strip().split(', ')
-
-                # CONVERTING
-                frame_id = int(frm_id)
-                x1, y1, x2, y2 = map(int, [x_min, y_min, x_max, y_max])
-                confidence = float(conf)
-                object_id = int(obj_id) if obj_id != 'N/A' else None
 
-                if frame_id not in bbox_values:
-                    bbox_values[frame_id] = []
-                bbox_values[frame_id].append((x1, y1, x2, y2, class_id, confidence, object_id))
-    except FileNotFoundError:
-        print(f"ERROR: The file {bbox_path} does not exist.")
+    bbox_values = open_bboxes_checked(bbox_path, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), fps, check_header, streaming)
+    if bbox_values is None:
+        cap.release()
         return
-    except IOError as io_err:
-        print(f"ERROR: Cannot read file {bbox_path}. DETAILS: {io_err}")
-        return
-    except Exception as e:
-        print(f"ERROR: {e}")
-        return
-
-    frame_idx = 0
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
 
-        if frame_idx in bbox_values:
-            print(f"In frame {frame_idx}\n")
+    output = create_video_writer(output_path, fps, (frame_width, frame_height), **(writer_config or {}))
 
-            for bbox in bbox_values[frame_idx]:
-                x1, y1, x2, y2, class_id, confidence, object_id = bbox
+    frame_idx = 0
+    try:
+        while cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                break
 
-                bbox_height = y2 - y1
-                crop_height = int(bbox_height * 0.2)
-                crop_height = max(crop_height, 25) # 25 is the min crop height
-                y2 = y1 + crop_height
+            bboxes = bbox_values.get(frame_idx)
+            if bboxes:
+                print(f"In frame {frame_idx}\n")
+                frame = anonymize_frame(frame, bboxes, blur_engine)
 
-                frame = anonymize_region(frame, x1, y1, x2, y2, object_id)
-        
-        output.write(frame)
-        frame_idx += 1
+            output.write(frame)
+            frame_idx += 1
+    except Exception as e:
+        print(f"ERROR: Anonymization stopped at frame {frame_idx}, removing the partial output. DETAILS: {e}")
+        cap.release()
+        output.release()
+        os.remove(output_path)
+        return
     print(f"Finished writing bounding boxes in the video")
     
     # RELEASE RESOURCES
@@ -78,8 +84,10 @@ def main(video_path, output_path, bbox_path):
     output.release()
 
 if __name__ == "__main__":
-    bbox_path = "./btrack_bboxes.txt"
+    bbox_path = "./btrack_bboxes.bin" # binary bbox store, or the .txt export
     video_path = "path/file.mp4"
     output_path = "./tracked_output.mp4"
+    blur_engine = BlurEngine(kernel = "box", draw_debug = True) # kernel: box, gaussian or pixelate
+    writer_config = {"backend": "opencv", "codec": "mp4v"} # or {"backend": "ffmpeg", "codec": "libx264", "preset": "veryfast", "crf": 23}
 
-    main(video_path, output_path, bbox_path)
+    main(video_path, output_path, bbox_path, blur_engine = blur_engine, writer_config = writer_config)
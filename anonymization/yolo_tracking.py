@@ -1,43 +1,282 @@
+import os
 import cv2
+import yaml
+import pickle
+import argparse
+import numpy as np
+from itertools import islice
+from bbox_store import open_bbox_writer
 from ultralytics import YOLO
+from ultralytics.utils import IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
+from ultralytics.trackers.basetrack import BaseTrack
+from ultralytics.trackers.byte_tracker import BYTETracker
+
+PERSON_CLASS_ID = 0
+INTERPOLATED_DET_IDX = -1 # det_idx of tracker rows filled in between detections
+INTERPOLATION_MARGIN = 0.1 # share of the box width/height added on each side of filled-in boxes
+CHECKPOINT_EVERY = 1000 # frames between checkpoints
+CHECKPOINT_SUFFIX = ".ckpt" # the checkpoint sits next to the bbox file
 
 def load_model(model_path):
     return YOLO(model_path)
 
-def main(model_path, video_path, bbox_path):
+def load_tracker(tracker_cfg = "bytetrack.yaml", detect_every = 1):
+    """Creates the ByteTrack tracker that model.track() would attach to the predictor.
+
+    With detect_every > 1 the tracker only sees every detect_every-th frame, so its
+    track buffer is shortened to keep lost tracks alive for the same time.
+    """
+    with open(check_yaml(tracker_cfg), 'r') as cfg_file:
+        cfg = IterableSimpleNamespace(**yaml.safe_load(cfg_file))
+    cfg.track_buffer = max(1, round(cfg.track_buffer / detect_every))
+    return BYTETracker(args = cfg)
+
+def iter_frames(cap):
+    """Yields the decoded frames of an opened capture."""
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame
+
+def expand_boxes(boxes, margin, frame_shape):
+    """Grows (N, 4) xyxy boxes by margin times their size on each side, clipped to the frame."""
+    frame_height, frame_width = frame_shape[:2]
+    pad = np.tile(boxes[:, 2:4] - boxes[:, 0:2], 2) * margin * np.array([-1, -1, 1, 1])
+    boxes = boxes + pad
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, frame_width)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, frame_height)
+    return boxes
+
+def fill_tracks(prev_idx, prev_tracks, next_idx, next_tracks, frame_idx, velocities):
+    """Returns tracker rows for a skipped frame between two detected frames.
+
+    Tracks found in both frames are interpolated linearly, tracks lost in the
+    next frame (or with no next frame yet) move on with their last velocity and
+    tracks that only appear in the next frame are held at their first box.
+    """
+    next_by_id = {int(track[4]): track for track in next_tracks}
+    prev_ids = set()
+    rows = []
+
+    for track in prev_tracks:
+        track_id = int(track[4])
+        prev_ids.add(track_id)
+        row = track.copy()
+        if track_id in next_by_id:
+            t = (frame_idx - prev_idx) / (next_idx - prev_idx)
+            row[:4] = (1 - t) * track[:4] + t * next_by_id[track_id][:4]
+        elif track_id in velocities:
+            row[:4] = track[:4] + velocities[track_id] * (frame_idx - prev_idx)
+        rows.append(row)
+
+    rows.extend(track.copy() for track_id, track in next_by_id.items() if track_id not in prev_ids)
+    if not rows:
+        return np.empty((0, 8))
+
+    rows = np.stack(rows)
+    rows[:, 7] = INTERPOLATED_DET_IDX
+    return rows
+
+def new_track_state():
+    """Returns the per-run state of track_frames, kept outside so it can be checkpointed."""
+    return {
+        "frame_idx": 0, # index of the next frame to decode
+        "prev_idx": None, # last detected frame
+        "prev_tracks": np.empty((0, 8)),
+        "velocities": {}, # track_id -> xyxy change per frame between its last two detections
+    }
+
+def track_frames(model, tracker, frames, batch_size = 1, iou = 0.8, conf = 0.1, detect_every = 1, margin = INTERPOLATION_MARGIN, state = None):
+    """Yields (frame, tracks) for every frame, running detection on whole batches.
+
+    Detection runs once per batch of decoded frames, then the detections are fed
+    into the tracker one frame at a time in decode order, so track IDs are the
+    same as with per-frame model.track(). Each tracks row is
+    [x1, y1, x2, y2, track_id, score, class_id, det_idx].
+
+    With detect_every = k only frames whose index is a multiple of k are detected
+    and tracked. The frames in between are held back until the next detected
+    frame and get their tracks from fill_tracks, grown by margin on each side and
+    marked with det_idx = INTERPOLATED_DET_IDX. A batch then spans batch_size * k
+    frames.
+
+    state (see new_track_state) is updated before each detected frame is yielded,
+    so at that point it describes everything up to and including that frame and
+    frames continues at state["frame_idx"].
+    """
+    frames = iter(frames)
+    state = state if state is not None else new_track_state()
+    pending = [] # (frame_idx, frame) skipped since the last detected frame
+
+    def flush(next_idx, next_tracks):
+        for skipped_idx, skipped_frame in pending:
+            tracks = fill_tracks(state["prev_idx"], state["prev_tracks"], next_idx, next_tracks, skipped_idx, state["velocities"])
+            tracks[:, :4] = expand_boxes(tracks[:, :4], margin, skipped_frame.shape)
+            yield skipped_frame, tracks
+        pending.clear()
+
+    while True:
+        batch = list(islice(frames, batch_size * detect_every))
+        if not batch:
+            break
+
+        first_idx = state["frame_idx"]
+        detected = [frame for frame_idx, frame in enumerate(batch, first_idx) if frame_idx % detect_every == 0]
+        # conf = 0.1 MATCHES THE LOW THRESHOLD model.track() HANDS TO BYTETRACK
+        results = iter(model.predict(detected, iou = iou, conf = conf, batch = len(detected), verbose = False) if detected else [])
+
+        for frame_idx, frame in enumerate(batch, first_idx):
+            if frame_idx % detect_every:
+                pending.append((frame_idx, frame))
+                state["frame_idx"] = frame_idx + 1
+                continue
+
+            tracks = tracker.update(next(results).boxes.cpu().numpy(), frame)
+            prev_idx, prev_tracks = state["prev_idx"], state["prev_tracks"]
+            if prev_idx is not None:
+                yield from flush(frame_idx, tracks)
+                prev_boxes = {int(track[4]): track[:4] for track in prev_tracks}
+                state["velocities"] = {
+                    int(track[4]): (track[:4] - prev_boxes[int(track[4])]) / (frame_idx - prev_idx)
+                    for track in tracks if int(track[4]) in prev_boxes
+                }
+
+            state.update(frame_idx = frame_idx + 1, prev_idx = frame_idx, prev_tracks = tracks)
+            yield frame, tracks
+
+    # FRAMES AFTER THE LAST DETECTION ONLY HAVE THE MOTION PREDICTION
+    yield from flush(None, np.empty((0, 8)))
+
+def tracks_to_bboxes(tracks):
+    """Converts tracker rows to (x1, y1, x2, y2, class_id, confidence, object_id, interpolated) person boxes."""
+    bboxes = []
+    for track in tracks:
+        class_id = int(track[6])
+        if class_id != PERSON_CLASS_ID:
+            continue
+
+        x1, y1, x2, y2 = track[:4].astype(int)
+        interpolated = int(track[7] == INTERPOLATED_DET_IDX)
+        bboxes.append((int(x1), int(y1), int(x2), int(y2), class_id, float(track[5]), int(track[4]), interpolated))
+    return bboxes
+
+def save_checkpoint(checkpoint_path, checkpoint):
+    """Pickles the checkpoint atomically, a crash mid-write keeps the previous one."""
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'wb') as checkpoint_file:
+        pickle.dump(checkpoint, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+def load_checkpoint(checkpoint_path):
+    """Returns the saved checkpoint, or None if there is none."""
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'rb') as checkpoint_file:
+        return pickle.load(checkpoint_file)
+
+def run_info(video_path, bbox_path, cap, detect_every):
+    """Identifies a tracking run, a checkpoint is only resumed by a run with the same info."""
+    return {
+        "video_path": os.path.abspath(video_path), "video_bytes": os.path.getsize(video_path),
+        "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), "bbox_path": os.path.abspath(bbox_path),
+        "detect_every": detect_every
+    }
+
+def checkpoint_mismatches(checkpoint, run):
+    """Returns the run info fields of the checkpoint that differ from the current run."""
+    saved = checkpoint.get("run", {})
+    return [f"{key} = {saved.get(key)}, not {value}" for key, value in run.items() if saved.get(key) != value]
+
+def seek_capture(cap, frame_idx):
+    """Moves the capture to frame_idx, grabbing forward from the start if the seek lands elsewhere."""
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_idx:
+        return True
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    for _ in range(frame_idx):
+        if not cap.grab():
+            return False
+    return True
+
+def main(model_path, video_path, bbox_path, batch_size = 1, detect_every = 1, resume = False, checkpoint_every = CHECKPOINT_EVERY):
+    """Tracks the people in a video and writes their boxes to bbox_path.
+
+    About every checkpoint_every frames the bbox file is flushed and the tracker
+    state, the next frame and the file offset are saved next to it (bbox_path +
+    CHECKPOINT_SUFFIX). With resume a run continues from that checkpoint: the
+    capture is moved to the first frame that was not flushed and the boxes are
+    appended to the file. The checkpoint must come from the same video, bbox
+    file and detect_every (see run_info). A run without resume deletes any old
+    checkpoint, and the checkpoint is removed once the whole video is done.
+    """
     model = load_model(model_path)
-    
+
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"ERROR: Cannot open video {video_path}.")
         return
 
-    with open(bbox_path, 'w') as bbox_file:
-        frame_id = 0
+    checkpoint_path = f"{bbox_path}{CHECKPOINT_SUFFIX}"
+    run = run_info(video_path, bbox_path, cap, detect_every)
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if resume and checkpoint is None:
+        print(f"WARNING: No checkpoint at {checkpoint_path}, starting from the first frame.")
+    if not resume and os.path.exists(checkpoint_path):
+        # A LATER --resume MUST NOT APPLY THE OLD RUN'S OFFSET AND TRACKER TO THIS RUN'S FILE
+        print(f"Removing the checkpoint of a previous run at {checkpoint_path}")
+        os.remove(checkpoint_path)
 
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
+    if checkpoint is None:
+        tracker, state = load_tracker(detect_every = detect_every), new_track_state()
+    else:
+        mismatches = checkpoint_mismatches(checkpoint, run)
+        if mismatches:
+            print(f"ERROR: {checkpoint_path} belongs to another run: {'; '.join(mismatches)}. Run without --resume to start over.")
+            cap.release()
+            return
+        tracker, state = checkpoint["tracker"], checkpoint["state"]
+        BaseTrack._count = checkpoint["track_count"] # next track id, a class-level counter
+        if not seek_capture(cap, state["frame_idx"]):
+            print(f"ERROR: Cannot seek {video_path} to frame {state['frame_idx']}.")
+            return
+        print(f"Resuming {video_path} at frame {state['frame_idx']}")
 
-            frame_id += 1
-            results = model.track(frame, persist = True, iou = 0.8, show = False, tracker = "bytetrack.yaml")
+    # FRAME IDS ARE 0-BASED DECODE INDICES, THE WRITER RECORDS THIS WITH THE FRAME COUNT AND FPS
+    resume_writer = checkpoint["writer"] if checkpoint else None
+    with open_bbox_writer(bbox_path, fps = cap.get(cv2.CAP_PROP_FPS), resume = resume_writer) as bbox_writer:
+        last_checkpoint = state["frame_idx"]
+        frames = track_frames(model, tracker, iter_frames(cap), batch_size = batch_size, detect_every = detect_every, state = state)
+        for frame_id, (frame, tracks) in enumerate(frames, state["frame_idx"]):
+            bbox_writer.write(frame_id, tracks_to_bboxes(tracks))
 
-            for box in results[0].boxes:
-                if box.cls[0] == 0:
-                    bbox = box.xyxy[0].cpu().numpy().astype(int)
-                    x1, y1, x2, y2 = bbox
-                    
-                    class_id = int(box.cls[0].item()) 
-                    confidence = float(box.conf[0].item()) 
-                    object_id = int(box.id[0]) if box.id is not None else -1
-                    bbox_file.write(f"{frame_id}, {x1}, {y1}, {x2}, {y2}, {class_id}, {confidence:.4f}, {object_id}\n")
+            # ONLY DETECTED FRAMES ARE SAFE POINTS, NO SKIPPED FRAME IS HELD BACK THERE
+            if state["prev_idx"] == frame_id and frame_id + 1 - last_checkpoint >= checkpoint_every:
+                save_checkpoint(checkpoint_path, {
+                    "run": run, "state": state, "tracker": tracker,
+                    "track_count": BaseTrack._count, "writer": bbox_writer.checkpoint()
+                })
+                last_checkpoint = frame_id + 1
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
 
     # RELEASE RESOURCES
     cap.release()
 
 if __name__ == "__main__":
-    bbox_file = "./btrack_bboxes.txt"
+    bbox_file = "./btrack_bboxes.bin" # use a .txt path for the text format
+    video_path = "path/file.mp4"
     model_path = "path/yolo11x.pt" # download the model: https://github.com/ultralytics/assets/releases/download/v8.3.0/yolo11x.pt
+    batch_size = 8 # frames decoded ahead and detected together, 1 = per-frame inference
+    detect_every = 1 # run detection every k frames and interpolate the tracks in between, e.g. 3 on calm scenes
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action = "store_true", help = "continue from the checkpoint next to the bbox file")
+    args = parser.parse_args()
 
-    main(model_path, video_path, bbox_file)
+    main(model_path, video_path, bbox_file, batch_size = batch_size, detect_every = detect_every, resume = args.resume)
@@ -3,7 +3,8 @@ import numpy as np
 
 class TrajectoryPlotter:
     @staticmethod
-    def plot_trajectories(video_path, save_path, human_config):
+    def plot_trajectories(video_path, save_path, human_config, codec = 'XVID', writer = None):
+        """Draws the trajectories over the video. writer can be any object with write()/release(), e.g. an ffmpeg pipe writer."""
         trajectories = [human_config[a]['trajectories'] for a in human_config]
         traj_starts = [human_config[a]['traj_start'] for a in human_config]
 
@@ -12,7 +13,7 @@ class TrajectoryPlotter:
         frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         frame_rate = int(cap.get(cv2.CAP_PROP_FPS))
 
-        out = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'XVID'), frame_rate, (frame_width, frame_height))
+        out = writer or cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*codec), frame_rate, (frame_width, frame_height))
 
         colors = np.array([
             [255, 255, 255], [0, 255, 255], [255, 0, 255],
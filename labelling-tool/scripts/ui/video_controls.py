@@ -1,14 +1,13 @@
 import os
-import cv2
 import numpy as np
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QIcon
 from utils.file_utils import list_video_files
 from utils.logging_utils import log_info, log_warning
-from video_proc_comps.video_player import VideoPlayer
+from video_proc_comps.video_player import VideoPlayer, OVERLAY_BACKENDS
 from video_proc_comps.playback_mode import PlaybackMode
 from PyQt6.QtWidgets import (
-    QWidget, QPushButton, QHBoxLayout, QSlider, QSizePolicy, QLabel, QVBoxLayout, QComboBox
+    QWidget, QPushButton, QHBoxLayout, QSlider, QSizePolicy, QLabel, QVBoxLayout, QComboBox, QCheckBox
 )
 
 class VideoControls(QWidget):
@@ -23,6 +22,15 @@ class VideoControls(QWidget):
         self.populate_video_list()
         # self.video_dropdown.currentIndexChanged.connect(self.load_video) 
 
+        # PLAYBACK OPTIONS, APPLIED WHEN THE NEXT VIDEO IS LOADED
+        self.proxy_checkbox = QCheckBox("Proxy")
+        self.proxy_checkbox.setChecked(self.video_player.use_proxy)
+        self.proxy_checkbox.setToolTip("Play a downscaled all-intra copy of the video, generated and cached on first load")
+        self.overlay_backend_dropdown = QComboBox()
+        self.overlay_backend_dropdown.addItems(OVERLAY_BACKENDS)
+        self.overlay_backend_dropdown.setCurrentText(self.video_player.overlay_backend)
+        self.overlay_backend_dropdown.setToolTip("Draw trajectories into a raster overlay image or as vector items in the scene")
+
         # SET THE CONTROLS IN THE LAYOUT
         self.setLayout(self.create_video_controls())
 
@@ -51,6 +59,9 @@ class VideoControls(QWidget):
     def create_video_controls(self):
         """Creates and returns the video control UI."""
 
+        # LOADING PROGRESS, SET BY THE PLAYER WHILE A VIDEO IS PREPARED
+        self.status_label = QLabel()
+
         # PLAYBACK BUTTONS
         self.rewind_button = self.create_button(self.resource_manager.get_icon("rewind", "rewind-60"), self.toggle_to_rewind)
         self.play_pause_button = self.create_button(self.resource_manager.get_icon("play", "play-60"), self.toggle_to_play)
@@ -59,7 +70,7 @@ class VideoControls(QWidget):
         self.upload_button = self.create_button(self.resource_manager.get_icon("upload", "upload-60"), self.load_video)
 
         playback_controls = QHBoxLayout()
-        for btn in [self.rewind_button, self.play_pause_button, self.stop_button, self.forward_button, self.video_dropdown, self.upload_button]:
+        for btn in [self.rewind_button, self.play_pause_button, self.stop_button, self.forward_button, self.status_label, self.proxy_checkbox, self.overlay_backend_dropdown, self.video_dropdown, self.upload_button]:
             playback_controls.addWidget(btn)
             if btn == self.forward_button:
                 playback_controls.addStretch(1)
@@ -99,14 +110,11 @@ class VideoControls(QWidget):
 
         video_path = self.resource_manager.get_video(selected_video)
         log_info(f"User selected video file: {video_path}")
-        self.video_player.load_video(video_path)
 
-        total_frames = int(self.video_player.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        if total_frames > 0:
-            self.frame_slider.setRange(0, total_frames)
-            self.max_frame_label.setText(str(total_frames))
-        else:
-            log_warning(f"Invalid frame count for {video_path}")
+        # THE PLAYER SETS THE SLIDER RANGE ONCE THE VIDEO IS PREPARED
+        self.video_player.use_proxy = self.proxy_checkbox.isChecked()
+        self.video_player.overlay_backend = self.overlay_backend_dropdown.currentText()
+        self.video_player.load_video(video_path)
     
     def toggle_to_play(self):
         """Toggles between play and pause, ensuring a single click pauses all playback modes."""
@@ -141,7 +149,7 @@ class VideoControls(QWidget):
         """Stops playback and resets to the first frame."""
         self.video_player.stop()
         self.video_player.trajectory_worker.overlay_cache.clear()
-        self.video_player.trajectory_overlay = np.zeros((self.video_player.video_height, self.video_player.video_width, 3), dtype=np.uint8)
+        self.video_player.update_trajectory_overlay(np.zeros((self.video_player.video_height, self.video_player.video_width, 3), dtype=np.uint8))
         self.play_pause_button.setIcon(QIcon(self.resource_manager.get_icon("play", "play-60")))
         self.frame_slider.setValue(0)
 
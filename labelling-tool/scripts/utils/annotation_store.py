@@ -0,0 +1,122 @@
+import sys
+import json
+import toml
+import sqlite3
+import numpy as np
+from .logging_utils import log_info
+
+STORE_SUFFIX = ".sqlite"
+STORE_VERSION = 1
+POINT_DTYPE = np.dtype("<f4") # trajectory points are stored as little-endian float32 (x, y) pairs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS humans (
+    name TEXT PRIMARY KEY,
+    traj_start INTEGER,
+    num_points INTEGER,
+    trajectory BLOB,
+    fields TEXT
+);
+"""
+
+def is_annotation_store(path):
+    return str(path).endswith(STORE_SUFFIX)
+
+class AnnotationStore:
+    """SQLite file holding the human annotations, one row per human.
+
+    Trajectories are float32 (N, 2) blobs, traj_start has its own column and
+    every other field (human_context, ...) is kept as JSON. Saving only writes
+    the rows of the humans that changed, in one transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.connection.execute("INSERT OR IGNORE INTO info VALUES ('version', ?)", (str(STORE_VERSION),))
+        self.connection.commit()
+
+    def load(self):
+        """Returns {human name: {"traj_start": ..., "trajectories": float32 (N, 2) array or None, ...}}."""
+        humans = {}
+        for name, traj_start, num_points, trajectory, fields in self.connection.execute("SELECT * FROM humans ORDER BY rowid"):
+            human = json.loads(fields) if fields else {}
+            human["traj_start"] = traj_start
+            human["trajectories"] = np.frombuffer(trajectory, dtype = POINT_DTYPE).reshape(num_points, 2) if trajectory is not None else None
+            humans[name] = human
+        return humans
+
+    def save(self, humans, names = None, deleted = ()):
+        """Writes the given humans (all of them if names is None) and removes the deleted ones."""
+        names = humans.keys() if names is None else names
+        rows = [self.to_row(name, humans[name]) for name in names if name in humans]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO humans VALUES (?, ?, ?, ?, ?)", rows)
+            self.connection.executemany("DELETE FROM humans WHERE name = ?", [(name,) for name in deleted])
+        return len(rows)
+
+    def replace_all(self, humans):
+        with self.connection:
+            self.connection.execute("DELETE FROM humans")
+        return self.save(humans)
+
+    @staticmethod
+    def to_row(name, human):
+        trajectory = human.get("trajectories")
+        fields = {key: value for key, value in human.items() if key not in ("traj_start", "trajectories")}
+        if trajectory is None:
+            return name, human.get("traj_start"), 0, None, json.dumps(fields)
+
+        points = np.ascontiguousarray(trajectory, dtype = POINT_DTYPE).reshape(-1, 2)
+        return name, human.get("traj_start"), len(points), points.tobytes(), json.dumps(fields)
+
+    def close(self):
+        self.connection.close()
+
+def to_toml_dict(humans):
+    """Converts loaded humans back to plain TOML values (point lists, no None fields)."""
+    result = {}
+    for name, human in humans.items():
+        result[name] = {}
+        for key, value in human.items():
+            if isinstance(value, np.ndarray):
+                value = value.tolist()
+            if value is not None:
+                result[name][key] = value
+    return result
+
+def import_toml(toml_path, store_path):
+    """Replaces the store's annotations with the ones of a human_config.toml."""
+    with open(toml_path, "r") as f:
+        humans = toml.load(f)
+
+    store = AnnotationStore(store_path)
+    count = store.replace_all(humans)
+    store.close()
+    log_info(f"Imported {count} humans from {toml_path} into {store_path}")
+    return count
+
+def export_toml(store_path, toml_path):
+    """Writes the store's annotations as a human_config.toml."""
+    store = AnnotationStore(store_path)
+    humans = store.load()
+    store.close()
+
+    with open(toml_path, "w") as f:
+        toml.dump(to_toml_dict(humans), f)
+    log_info(f"Exported {len(humans)} humans from {store_path} to {toml_path}")
+    return len(humans)
+
+if __name__ == "__main__":
+    # python -m utils.annotation_store import human_config.toml human_config.sqlite
+    # python -m utils.annotation_store export human_config.sqlite human_config.toml
+    if len(sys.argv) != 4 or sys.argv[1] not in ("import", "export"):
+        print("Usage: python -m utils.annotation_store import <toml> <store> | export <store> <toml>")
+        sys.exit(1)
+
+    if sys.argv[1] == "import":
+        import_toml(sys.argv[2], sys.argv[3])
+    else:
+        export_toml(sys.argv[2], sys.argv[3])
@@ -1,12 +1,32 @@
+import os
 import toml
 from .logging_utils import log_info, log_warning
+from .annotation_store import AnnotationStore, is_annotation_store, to_toml_dict
 
 class HumanConfigUtils():
+    """Human annotations, loaded from a human_config.toml or an annotation store (.sqlite).
+
+    Humans changed through newID_init, set_element and delete_ID are tracked, so
+    saving back to the store they were loaded from only writes those.
+    """
+
     def __init__(self, path):
+        self.path = path
+        self.changed = set() # human names written or deleted since the last load or save
         self.dict = self.load_human_config(path)
         self.used_indices = [int(key.replace("human", "")) for key in self.dict.keys()]
 
     def load_human_config(self, path):
+        if is_annotation_store(path):
+            if not os.path.exists(path):
+                log_warning(f"Annotation store {path} not found. Using an empty dict")
+                return {}
+            store = AnnotationStore(path)
+            humans = store.load()
+            store.close()
+            log_info(f"Loaded {len(humans)} humans from {path}")
+            return humans
+
         try:
             with open(path, "r") as f:
                 return toml.load(f)
@@ -14,10 +34,21 @@ class HumanConfigUtils():
             log_warning(f"Human Config file {path} not found. Using an empty dict")
             return {}
     
-    def save_human_config(self, path):
-        with open(path, 'w') as f:
-            toml.dump(self.dict, f)
-            log_info(f"Config file was saved to {path}.")
+    def save_human_config(self, path = None):
+        path = path or self.path
+        if is_annotation_store(path):
+            store = AnnotationStore(path)
+            if os.path.abspath(path) == os.path.abspath(self.path):
+                count = store.save(self.dict, [name for name in self.changed if name in self.dict], [name for name in self.changed if name not in self.dict])
+            else:
+                count = store.replace_all(self.dict)
+            store.close()
+            log_info(f"Annotation store {path} was saved ({count} humans written).")
+        else:
+            with open(path, 'w') as f:
+                toml.dump(to_toml_dict(self.dict), f)
+                log_info(f"Config file was saved to {path}.")
+        self.changed.clear()
             
     def __len__(self):
         return len(self.dict)
@@ -39,12 +70,14 @@ class HumanConfigUtils():
         self.dict[newHuman_name]["trajectories"] = None
         self.dict[newHuman_name]["traj_start"] = None
         self.dict[newHuman_name]["human_context"] = None
+        self.changed.add(newHuman_name)
         
         return newHuman_ID
     
     def delete_ID(self, humanID):
         if f"human{humanID}" in self.dict:
             self.dict.pop(f"human{humanID}", None)
+            self.changed.add(f"human{humanID}")
             # del self.dict[f"human{humanID}"]
             log_info(f"Deleted trajectory ID: {humanID}")
         else:
@@ -62,5 +95,6 @@ class HumanConfigUtils():
     def set_element(self, humanID, elementName, value):
         if f"human{humanID}" not in self.dict:
             log_warning(f"Creating new entry for missing humanID: {humanID}")
-            self.dict[f"humanID{humanID}"] = {}
+            self.dict[f"human{humanID}"] = {}
         self.dict[f"human{humanID}"][elementName] = value
+        self.changed.add(f"human{humanID}")
@@ -1,5 +1,6 @@
 import os
 from .logging_utils import log_info, log_warning
+from .annotation_store import STORE_SUFFIX
 
 class ResourceManager:
     """Handles resource file paths dynamically"""
@@ -28,7 +29,10 @@ class ResourceManager:
         return os.path.join(self.resources_path, "styles.qss")
 
     def get_human_config(self):
-        """Returns the path of human_config.toml."""
+        """Returns the path of the annotation store human_config.sqlite if there is one, else of human_config.toml."""
+        store_path = os.path.join(self.config_path, f"human_config{STORE_SUFFIX}")
+        if os.path.exists(store_path):
+            return store_path
         return os.path.join(self.config_path, "human_config.toml")
 
     def get_video(self, name):
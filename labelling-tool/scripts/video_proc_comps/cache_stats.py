@@ -0,0 +1,31 @@
+class CacheStats:
+    """Hit, miss and eviction counters of the byte-bounded caches (FrameCache, OverlayCache).
+
+    Subclasses set lock, nbytes and max_bytes, implement __len__, and list any
+    extra counters in STAT_COUNTERS.
+    """
+
+    STAT_COUNTERS = ("hits", "misses", "evictions")
+
+    def reset_stats(self):
+        for name in self.STAT_COUNTERS:
+            setattr(self, name, 0)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        with self.lock:
+            stats = {"frames": len(self), "bytes": self.nbytes, "max_bytes": self.max_bytes}
+            stats.update({name: getattr(self, name) for name in self.STAT_COUNTERS})
+            stats["hit_rate"] = self.hit_rate()
+            return stats
+
+def prefetch_window(max_frames, max_bytes, frame_bytes):
+    """Returns how many frames to prefetch into a cache of max_bytes, at most max_frames.
+
+    The window is kept to half the budget so prefetched frames are not evicted
+    before they are shown.
+    """
+    return max(1, min(max_frames, max_bytes // max(1, frame_bytes) // 2))
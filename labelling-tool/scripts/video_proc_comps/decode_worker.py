@@ -0,0 +1,113 @@
+import cv2
+from .frame_reader import FrameReader
+from utils.logging_utils import log_info, log_error
+from PyQt6.QtCore import QThread, QMutex, QWaitCondition
+
+PREFETCH_WINDOW = 30 # frames decoded ahead of the playhead (~1 sec)
+REWIND_CHUNK = 30 # frames decoded forward per chunk while rewinding
+
+class DecodeWorker(QThread):
+    """Decodes the frames ahead of the playhead into the shared frame cache.
+
+    The GUI thread calls request() with the frame it shows and the playback step
+    (negative while rewinding). The worker then decodes the next `window` frames
+    on that path with its own capture, so the timer only has to convert and
+    display them. Going backwards it decodes chunks forward, starting with the
+    chunk just behind the playhead, and caches the frames the rewind will show,
+    instead of seeking once per tick. Chunks are whole GOPs when the VideoIndex
+    knows the keyframes and REWIND_CHUNK frames otherwise. A new request
+    interrupts the window being decoded.
+    """
+
+    def __init__(self, video_path, frame_cache, total_frames, window = PREFETCH_WINDOW, index = None):
+        super().__init__()
+        self.video_path = video_path
+        self.index = index
+        self.frame_cache = frame_cache
+        self.total_frames = total_frames
+        self.window = window
+
+        self.mutex = QMutex()
+        self.condition = QWaitCondition()
+        self.running = True
+        self.generation = 0 # bumped by every request, the worker drops stale windows
+        self.frame_number = 0
+        self.step = 1
+        self.decoded = 0
+
+    def request(self, frame_number, step):
+        """Asks for the frames frame_number + step, frame_number + 2 * step, ... to be decoded."""
+        self.mutex.lock()
+        self.frame_number = frame_number
+        self.step = step
+        self.generation += 1
+        self.condition.wakeOne()
+        self.mutex.unlock()
+
+    def run(self):
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            log_error(f"DecodeWorker failed to open video file: {self.video_path}")
+            return
+        reader = FrameReader(cap, index = self.index)
+        generation = 0
+
+        while True:
+            self.mutex.lock()
+            while self.running and self.generation == generation:
+                self.condition.wait(self.mutex)
+            running, generation = self.running, self.generation
+            frame_number, step = self.frame_number, self.step
+            self.mutex.unlock()
+
+            if not running:
+                break
+
+            targets = [frame_number + i * step for i in range(1, self.window + 1)]
+            targets = [target for target in targets if 0 <= target < self.total_frames and target not in self.frame_cache]
+
+            try:
+                if step > 0:
+                    self.decode_forward(reader, targets, generation)
+                else:
+                    self.decode_backward(reader, targets, generation)
+            except Exception as e:
+                log_error(f"DecodeWorker failed near frame {frame_number}: {e}")
+
+        cap.release()
+
+    def is_stale(self, generation):
+        return self.generation != generation
+
+    def decode_forward(self, reader, targets, generation = None):
+        """Decodes ascending targets, stopping early if a newer request arrives (unless generation is None)."""
+        for target in targets:
+            if generation is not None and self.is_stale(generation):
+                return
+            frame = reader.read(target)
+            if frame is None:
+                return
+            self.frame_cache.put(target, frame)
+            self.decoded += 1
+
+    def decode_backward(self, reader, targets, generation):
+        """Decodes descending targets chunk by chunk, each chunk forward from its first frame."""
+        while targets:
+            keyframe = self.index.keyframe_before(targets[0]) if self.index else None
+            chunk_start = keyframe if keyframe is not None else max(0, targets[0] - REWIND_CHUNK + 1)
+            chunk = [target for target in targets if target >= chunk_start]
+            targets = targets[len(chunk):]
+
+            # A CHUNK IS NOT INTERRUPTED, RESTARTING IT WOULD SEEK BACK TO ITS START AGAIN
+            self.decode_forward(reader, chunk[::-1])
+            if self.is_stale(generation):
+                return
+
+    def stop(self):
+        """Gracefully stops the thread."""
+        self.mutex.lock()
+        self.running = False
+        self.condition.wakeOne()
+        self.mutex.unlock()
+        self.wait()
+        log_info(f"DecodeWorker stopped after prefetching {self.decoded} frames.")
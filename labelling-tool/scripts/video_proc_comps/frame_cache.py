@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+from .cache_stats import CacheStats
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2 # about 80 decoded 1080p BGR frames
+
+class FrameCache(CacheStats):
+    """Decoded frames keyed by frame number, bounded by a byte budget.
+
+    The least recently used frames are evicted once the cached frames would take
+    more than max_bytes. Hits, misses and evictions are counted for tuning. The
+    cache is shared with the decode worker, so every access takes a lock.
+    """
+
+    def __init__(self, max_bytes = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+        self.nbytes = 0
+        self.reset_stats()
+
+    def get(self, frame_number):
+        """Returns the cached frame and marks it as recently used, or None on a miss."""
+        with self.lock:
+            frame = self.frames.get(frame_number)
+            if frame is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.frames.move_to_end(frame_number)
+            return frame
+
+    def put(self, frame_number, frame):
+        """Caches a frame, evicting the least recently used ones to stay within max_bytes."""
+        if frame is None or frame.nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if frame_number in self.frames:
+                self.nbytes -= self.frames.pop(frame_number).nbytes
+            self.frames[frame_number] = frame
+            self.nbytes += frame.nbytes
+
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.frames.popitem(last = False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.nbytes = 0
+
+    def __contains__(self, frame_number):
+        with self.lock:
+            return frame_number in self.frames
+
+    def __len__(self):
+        return len(self.frames)
@@ -0,0 +1,69 @@
+BUCKET_FRAMES = 64 # frames per bucket, a trajectory is listed in every bucket it overlaps
+
+class FrameIntervalIndex:
+    """Answers which [start, end) frame intervals cover a frame or overlap a frame range.
+
+    The frames are split into fixed buckets, each holding the ids of the
+    intervals overlapping it, so a query only checks the intervals of the
+    buckets it touches instead of every interval. Ids come back in the order
+    they were added.
+    """
+
+    def __init__(self, bucket_frames = BUCKET_FRAMES):
+        self.bucket_frames = bucket_frames
+        self.intervals = {} # id -> (start, end, insertion order)
+        self.buckets = {} # bucket -> {id: None}, dicts keep the insertion order
+        self.added = 0
+
+    def add(self, key, start, end):
+        if key in self.intervals:
+            self.remove(key)
+        self.intervals[key] = (start, end, self.added)
+        self.added += 1
+        for bucket in self.bucket_range(start, end):
+            self.buckets.setdefault(bucket, {})[key] = None
+
+    def remove(self, key):
+        if key not in self.intervals:
+            return
+        start, end, _ = self.intervals.pop(key)
+        for bucket in self.bucket_range(start, end):
+            ids = self.buckets.get(bucket)
+            if ids is not None:
+                ids.pop(key, None)
+                if not ids:
+                    del self.buckets[bucket]
+
+    def clear(self):
+        self.intervals = {}
+        self.buckets = {}
+
+    def copy(self):
+        """Returns an independent index with the same intervals."""
+        index = FrameIntervalIndex(self.bucket_frames)
+        index.intervals = dict(self.intervals)
+        index.buckets = {bucket: dict(ids) for bucket, ids in self.buckets.items()}
+        index.added = self.added
+        return index
+
+    def bucket_range(self, start, end):
+        if end <= start:
+            return range(0)
+        return range(start // self.bucket_frames, (end - 1) // self.bucket_frames + 1)
+
+    def at(self, frame):
+        """Returns the ids whose interval contains frame."""
+        ids = self.buckets.get(frame // self.bucket_frames, {})
+        return [key for key in ids if self.intervals[key][0] <= frame < self.intervals[key][1]]
+
+    def overlapping(self, start, end):
+        """Returns the ids whose interval overlaps [start, end)."""
+        found = set()
+        for bucket in self.bucket_range(start, end):
+            for key in self.buckets.get(bucket, ()):
+                if key not in found and self.intervals[key][0] < end and start < self.intervals[key][1]:
+                    found.add(key)
+        return sorted(found, key = lambda key: self.intervals[key][2])
+
+    def __len__(self):
+        return len(self.intervals)
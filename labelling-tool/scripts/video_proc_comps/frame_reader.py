@@ -0,0 +1,69 @@
+import cv2
+
+MAX_GRAB_AHEAD = 30 # decoding this many frames forward is cheaper than a keyframe seek on long-GOP mp4s
+
+class FrameReader:
+    """Reads frames from a cv2.VideoCapture, seeking only on real jumps.
+
+    The reader tracks the frame the decoder returns next. Targets up to
+    max_grab_ahead frames ahead are reached with grab() and read(), anything
+    else (backwards or far ahead) seeks. With a VideoIndex, reading also
+    continues forward whenever the target is in the GOP being decoded, and the
+    timestamp of every frame read after a seek is checked against the index, so
+    an inaccurate seek is corrected instead of showing the wrong frame.
+    """
+
+    def __init__(self, cap, max_grab_ahead = MAX_GRAB_AHEAD, index = None):
+        self.cap = cap
+        self.max_grab_ahead = max_grab_ahead
+        self.index = index
+        self.position = 0 # next frame the decoder returns, None when unknown
+        self.seeks = 0
+        self.corrections = 0
+        self.sequential_reads = 0
+
+    def read(self, frame_number):
+        """Returns the decoded frame at frame_number, or None if it cannot be read."""
+        keyframe = self.index.keyframe_before(frame_number) if self.index else None
+        ahead = frame_number - self.position if self.position is not None else -1
+
+        if 0 <= ahead and (ahead <= self.max_grab_ahead or (keyframe is not None and self.position >= keyframe)):
+            self.sequential_reads += 1
+            frame = self.read_forward(ahead)
+        else:
+            self.seeks += 1
+            frame = self.seek_read(frame_number)
+
+        self.position = frame_number + 1 if frame is not None else None
+        return frame
+
+    def read_forward(self, skip):
+        """Skips `skip` frames and returns the next one."""
+        for _ in range(skip):
+            if not self.cap.grab():
+                return None
+
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def seek_read(self, frame_number):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+        frame = self.read_forward(0)
+        if frame is None or self.index is None:
+            return frame
+
+        # CHECK WHERE THE SEEK LANDED, VARIABLE-GOP FILES CAN BE OFF BY A FEW FRAMES
+        landed = self.index.frame_at(self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+        start = frame_number
+        while landed > frame_number and start > 0:
+            start = max(0, start - self.max_grab_ahead)
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            frame = self.read_forward(0)
+            if frame is None:
+                return None
+            landed = self.index.frame_at(self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+
+        if landed != frame_number:
+            self.corrections += 1
+            frame = self.read_forward(frame_number - landed - 1)
+        return frame
@@ -0,0 +1,111 @@
+import threading
+from .cache_stats import CacheStats
+
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2 # about 40 full-resolution 1080p overlays
+BEHIND_WEIGHT = 2 # frames behind the playback direction count this much farther when evicting
+
+class OverlayCache(CacheStats):
+    """Rendered trajectory overlays keyed by frame number, bounded by a byte budget.
+
+    An overlay can come with its trajectory pick buffer (see pick_buffer.py),
+    stored, counted and evicted together with it. Every overlay remembers the
+    trajectories drawn into it, so an edit or a
+    selection change only drops the frames showing those trajectories. Once the
+    overlays would take more than max_bytes, the ones farthest from the
+    playhead are evicted, frames behind the playback direction first. Hits,
+    misses and evictions are counted like in FrameCache.
+    """
+
+    STAT_COUNTERS = CacheStats.STAT_COUNTERS + ("invalidations",)
+
+    def __init__(self, max_bytes = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.overlays = {} # frame -> (overlay, frozenset of the trajectories drawn in it, pick buffer, bytes)
+        self.lock = threading.Lock()
+        self.nbytes = 0
+        self.playhead = 0
+        self.direction = 1
+        self.reset_stats()
+
+    def set_playhead(self, frame_number, step = 1):
+        """Moves the point eviction distances are measured from, step gives the playback direction."""
+        with self.lock:
+            self.playhead = frame_number
+            if step:
+                self.direction = 1 if step > 0 else -1
+
+    def get(self, frame_number):
+        """Returns the cached overlay, or None on a miss."""
+        with self.lock:
+            entry = self.overlays.get(frame_number)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, frame_number):
+        """Returns the cached overlay or None, without counting a hit or miss."""
+        with self.lock:
+            entry = self.overlays.get(frame_number)
+            return entry[0] if entry is not None else None
+
+    def get_pick_buffer(self, frame_number):
+        """Returns the pick buffer cached with the frame's overlay, or None."""
+        with self.lock:
+            entry = self.overlays.get(frame_number)
+            return entry[2] if entry is not None else None
+
+    def put(self, frame_number, overlay, traj_ids, pick_buffer = None):
+        """Caches an overlay, evicting the ones farthest from the playhead to stay within max_bytes."""
+        if overlay is None:
+            return
+        nbytes = overlay.nbytes + (pick_buffer.nbytes if pick_buffer is not None else 0)
+        if nbytes > self.max_bytes:
+            return
+
+        with self.lock:
+            if frame_number in self.overlays:
+                self.nbytes -= self.overlays.pop(frame_number)[3]
+            self.overlays[frame_number] = (overlay, frozenset(traj_ids), pick_buffer, nbytes)
+            self.nbytes += nbytes
+
+            while self.nbytes > self.max_bytes:
+                evicted = max(self.overlays, key = self.eviction_distance)
+                self.nbytes -= self.overlays.pop(evicted)[3]
+                self.evictions += 1
+
+    def eviction_distance(self, frame_number):
+        ahead = (frame_number - self.playhead) * self.direction
+        return ahead if ahead >= 0 else -ahead * BEHIND_WEIGHT
+
+    def invalidate(self, traj_ids):
+        """Drops the overlays showing any of the given trajectories."""
+        traj_ids = set(traj_ids)
+        if not traj_ids:
+            return
+
+        with self.lock:
+            for frame_number in [frame_number for frame_number, (_, drawn, _, _) in self.overlays.items() if not drawn.isdisjoint(traj_ids)]:
+                self.nbytes -= self.overlays.pop(frame_number)[3]
+                self.invalidations += 1
+
+    def invalidate_range(self, start, end):
+        """Drops the overlays of the frames in [start, end)."""
+        with self.lock:
+            for frame_number in [frame_number for frame_number in self.overlays if start <= frame_number < end]:
+                self.nbytes -= self.overlays.pop(frame_number)[3]
+                self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.overlays.clear()
+            self.nbytes = 0
+
+    def __contains__(self, frame_number):
+        with self.lock:
+            return frame_number in self.overlays
+
+    def __len__(self):
+        return len(self.overlays)
@@ -0,0 +1,35 @@
+import numpy as np
+
+PICK_SHIFT = 1 # the pick buffer has 1 / 2 ** PICK_SHIFT of the overlay's resolution
+PICK_THICKNESS = 2 # line width in the pick buffer, the overlay's 4 px at half resolution
+
+def pick_buffer_shape(width, height):
+    """Returns the (rows, cols) of the pick buffer of a width x height overlay."""
+    scale = 1 << PICK_SHIFT
+    return -(-height // scale), -(-width // scale)
+
+def pick_trajectory(pick_buffer, x, y, max_distance):
+    """Returns the trajectory id drawn nearest to the overlay pixel (x, y) within max_distance, or None.
+
+    The buffer holds traj_id + 1 where a trajectory line is drawn and 0 elsewhere.
+    """
+    scale = 1 << PICK_SHIFT
+    row, col, radius = int(y) // scale, int(x) // scale, int(max_distance) // scale
+    rows, cols = pick_buffer.shape
+    if not (0 <= row < rows and 0 <= col < cols):
+        return None
+
+    if pick_buffer[row, col]:
+        return int(pick_buffer[row, col]) - 1
+
+    top, left = max(0, row - radius), max(0, col - radius)
+    window = pick_buffer[top:row + radius + 1, left:col + radius + 1]
+    hits = np.argwhere(window)
+    if not len(hits):
+        return None
+
+    distances = np.hypot(hits[:, 0] + top - row, hits[:, 1] + left - col)
+    nearest = int(np.argmin(distances))
+    if distances[nearest] > radius:
+        return None
+    return int(window[tuple(hits[nearest])]) - 1
@@ -0,0 +1,80 @@
+import os
+import cv2
+import json
+from .video_index import file_signature
+from utils.logging_utils import log_info, log_warning, log_error
+
+PROXY_MAX_SIZE = (1092, 888) # the view size, larger frames are only downsampled by fitInView
+PROXY_SUFFIX = ".proxy.avi"
+PROXY_QUALITY = 90
+PROGRESS_STEP = 100 # frames between two progress callbacks
+
+def proxy_size(width, height, max_size = PROXY_MAX_SIZE):
+    """Returns the even (width, height) that fits max_size with the same aspect ratio, never upscaling."""
+    scale = min(1.0, max_size[0] / width, max_size[1] / height)
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+def make_proxy(video_path, proxy_path, max_size = PROXY_MAX_SIZE, progress = None):
+    """Transcodes the video to a downscaled MJPG file, where every frame is a keyframe.
+
+    progress(frames_written, estimated_total) is called every PROGRESS_STEP frames,
+    an exception raised by it aborts the transcode.
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    estimated_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    size = proxy_size(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), max_size)
+
+    output = cv2.VideoWriter(proxy_path, cv2.VideoWriter_fourcc(*'MJPG'), fps, size, [cv2.VIDEOWRITER_PROP_QUALITY, PROXY_QUALITY])
+    if not output.isOpened():
+        cap.release()
+        raise IOError(f"Cannot open a proxy writer for {proxy_path}")
+
+    frame_count = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            output.write(cv2.resize(frame, size, interpolation = cv2.INTER_AREA))
+            frame_count += 1
+            if frame_count % 1000 == 0:
+                log_info(f"Proxy for {video_path}: {frame_count} frames written")
+            if progress is not None and frame_count % PROGRESS_STEP == 0:
+                progress(frame_count, estimated_total)
+    finally:
+        cap.release()
+        output.release()
+    return frame_count
+
+def load_proxy(video_path, max_size = PROXY_MAX_SIZE, progress = None):
+    """Returns the path of the video's proxy, transcoding it first if it is missing or stale.
+
+    The proxy sits next to the video with a small JSON sidecar recording the
+    source's size and mtime. Returns None if the proxy cannot be made, in which
+    case the original video should be played. progress is passed to make_proxy.
+    """
+    proxy_path = f"{video_path}{PROXY_SUFFIX}"
+    info_path = f"{proxy_path}.json"
+    signature = {**file_signature(video_path), "max_size": list(max_size)}
+
+    try:
+        with open(info_path, "r") as info_file:
+            if json.load(info_file) == signature and os.path.exists(proxy_path):
+                return proxy_path
+    except FileNotFoundError:
+        pass
+    except ValueError as e:
+        log_warning(f"Ignoring unreadable proxy info {info_path}: {e}")
+
+    log_info(f"Generating proxy {proxy_path}")
+    try:
+        frame_count = make_proxy(video_path, proxy_path, max_size, progress)
+        with open(info_path, "w") as info_file:
+            json.dump(signature, info_file)
+    except (IOError, OSError, cv2.error) as e:
+        log_error(f"Failed to generate proxy for {video_path}: {e}")
+        return None
+
+    log_info(f"Proxy ready: {proxy_path} ({frame_count} frames)")
+    return proxy_path
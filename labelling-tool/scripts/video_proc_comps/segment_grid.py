@@ -0,0 +1,76 @@
+import numpy as np
+
+GRID_CELL = 32 # pixels per grid cell side
+
+class SegmentGrid:
+    """Uniform grid over the segments of some polylines, for nearest-polyline queries.
+
+    Every segment is listed in all the cells its bounding box covers. A query
+    only measures the exact point-to-segment distance to the segments of the
+    cells around the query point.
+    """
+
+    def __init__(self, polylines, cell_size = GRID_CELL):
+        """polylines maps an id to an (N, 2) array of points, polylines with less than 2 points are ignored."""
+        self.cell_size = cell_size
+        owners, starts, ends = [], [], []
+        for key, points in polylines.items():
+            if len(points) < 2:
+                continue
+            points = np.asarray(points, dtype = np.float64)
+            starts.append(points[:-1])
+            ends.append(points[1:])
+            owners.extend([key] * (len(points) - 1))
+
+        self.owners = owners
+        self.starts = np.concatenate(starts) if starts else np.zeros((0, 2))
+        self.ends = np.concatenate(ends) if ends else np.zeros((0, 2))
+
+        # ONE (CELL, SEGMENT) PAIR PER CELL COVERED BY EACH SEGMENT'S BOUNDING BOX, SORTED BY CELL
+        low = np.floor(np.minimum(self.starts, self.ends) / cell_size).astype(np.int64)
+        high = np.floor(np.maximum(self.starts, self.ends) / cell_size).astype(np.int64)
+        spans = high - low + 1
+        counts = spans[:, 0] * spans[:, 1]
+        segments = np.repeat(np.arange(len(counts)), counts)
+        local = np.arange(len(segments)) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = low[segments, 0] + local % spans[segments, 0]
+        cell_y = low[segments, 1] + local // spans[segments, 0]
+
+        order = np.lexsort((cell_x, cell_y))
+        self.cell_segments = segments[order]
+        # np.unique SORTS THE (ROW, COLUMN) PAIRS LIKE lexsort, SO first GIVES THE START OF EACH CELL'S RUN
+        cells, first = np.unique(np.stack([cell_y[order], cell_x[order]], axis = 1), axis = 0, return_index = True)
+        bounds = np.append(first, len(order))
+        self.cells = {(cx, cy): (bounds[i], bounds[i + 1]) for i, (cy, cx) in enumerate(cells.tolist())}
+
+    def nearest(self, x, y, max_distance):
+        """Returns (id, distance) of the polyline closest to (x, y) within max_distance, or (None, None)."""
+        if not len(self.cell_segments):
+            return None, None
+
+        first_x, last_x = int((x - max_distance) // self.cell_size), int((x + max_distance) // self.cell_size)
+        first_y, last_y = int((y - max_distance) // self.cell_size), int((y + max_distance) // self.cell_size)
+        candidates = []
+        for cell_y in range(first_y, last_y + 1):
+            for cell_x in range(first_x, last_x + 1):
+                if (cell_x, cell_y) in self.cells:
+                    start, end = self.cells[(cell_x, cell_y)]
+                    candidates.append(self.cell_segments[start:end])
+
+        if not candidates:
+            return None, None
+        candidates = np.unique(np.concatenate(candidates))
+
+        distances = point_segment_distances(np.array([x, y], dtype = np.float64), self.starts[candidates], self.ends[candidates])
+        best = int(np.argmin(distances))
+        if distances[best] > max_distance:
+            return None, None
+        return self.owners[candidates[best]], float(distances[best])
+
+def point_segment_distances(point, starts, ends):
+    """Distances from a point to the segments starts[i] -> ends[i]."""
+    direction = ends - starts
+    length_sq = np.einsum("ij,ij->i", direction, direction)
+    t = np.einsum("ij,ij->i", point - starts, direction) / np.where(length_sq > 0, length_sq, 1)
+    closest = starts + np.clip(t, 0, 1)[:, None] * direction
+    return np.hypot(*(closest - point).T)
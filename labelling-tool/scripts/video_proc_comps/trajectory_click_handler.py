@@ -1,10 +1,13 @@
-import numpy as np
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QPen, QBrush
+from .segment_grid import SegmentGrid
+from .pick_buffer import pick_trajectory
 from .playback_mode import PlaybackMode
-from utils.logging_utils import log_info, log_error
+from utils.logging_utils import log_info
 from PyQt6.QtWidgets import QGraphicsView, QGraphicsPixmapItem, QGraphicsEllipseItem
 
+SELECT_DISTANCE = 12 # pixels from a trajectory line that still select it (half its width plus a 10 px margin)
+
 class TrajectoryClickHandler(QGraphicsView):
     def __init__(self, trajectory_manager, scene, trajectory_overlay, color_generator, parent = None):
         super().__init__(parent)
@@ -14,6 +17,9 @@ class TrajectoryClickHandler(QGraphicsView):
         self.color_generator = color_generator
         self.trajectory_manager = trajectory_manager 
         self.trajectory_overlay = trajectory_overlay
+        self.segment_grid = None # lines drawn at grid_key = (frame, trajectory version), built on the first click there
+        self.grid_key = None
+        self.overlay_cache = None # set by the player in raster mode, its pick buffers answer clicks with a lookup
 
     def mousePressEvent(self, event):
         """Handles mouse click events and selects the closest trajectory."""
@@ -26,10 +32,6 @@ class TrajectoryClickHandler(QGraphicsView):
         click_marker.setBrush(QBrush(Qt.GlobalColor.red))
         self.graphics_scene.addItem(click_marker)
 
-        if self.trajectory_overlay is None:
-            log_error("ERROR: Click handler has no overlay assigned!")
-            return
-
         found_trajectory = False
 
         for item in self.graphics_scene.items(scene_pos):
@@ -42,7 +44,8 @@ class TrajectoryClickHandler(QGraphicsView):
                 orig_y = int((item_pos.y() / pixmap_item.boundingRect().height()) * pixmap_rect.height())
                 log_info(f"Mapped pixel coordinates: (x={orig_x}, y={orig_y})")
 
-                selected_traj_id = self.get_trajectory_from_overlay(orig_x, orig_y)  
+                # TRAJECTORIES ARE SCALED TO THE PLAYED FRAME SIZE (THE PROXY'S IN PROXY MODE), SO CLICKS ARE MATCHED IN ITS PIXELS
+                selected_traj_id = self.get_trajectory_at(orig_x, orig_y)
 
                 if selected_traj_id is not None:
                     log_info(f"Selected trajectory ID: {selected_traj_id}")
@@ -63,31 +66,39 @@ class TrajectoryClickHandler(QGraphicsView):
 
         super().mousePressEvent(event)
 
-    def get_trajectory_from_overlay(self, x, y):
-        if self.trajectory_overlay is None:
-            log_info("Trajectory overlay is None")
-            return None
-        
-        if not (0 <= x < self.trajectory_overlay.shape[1] and 0 <= y < self.trajectory_overlay.shape[0]):
-            log_info(f"Click out of bounds: (x={x}, y={y}), Overlay size: {self.trajectory_overlay.shape}")
+    def get_trajectory_at(self, x, y):
+        """Returns the trajectory whose line drawn at the current frame is nearest to the displayed pixel (x, y).
+
+        The pick buffer cached with the frame's overlay is looked up when there
+        is one, otherwise the distance to the trajectory segments is measured.
+        Both go by trajectory ids, not overlay colors, so trajectories with
+        similar colors are told apart.
+        """
+        pick_buffer = self.overlay_cache.get_pick_buffer(self.current_frame) if self.overlay_cache is not None else None
+        if pick_buffer is not None:
+            traj_id = pick_trajectory(pick_buffer, x, y, SELECT_DISTANCE)
+            source = "pick buffer"
+        else:
+            traj_id, distance = self.get_segment_grid().nearest(x, y, SELECT_DISTANCE)
+            source = f"{distance:.1f} px" if traj_id is not None else None
+
+        if traj_id is None:
+            log_info("No trajectory found in neighborhood")
             return None
 
-        TOLERANCE = 30
-        SEARCH_RADIUS = 10
-
-        for delta_y in range(-SEARCH_RADIUS, SEARCH_RADIUS + 1):
-            for delta_x in range(-SEARCH_RADIUS, SEARCH_RADIUS + 1):
-                new_y, new_x = (y + delta_y), x + delta_x
-                if 0 <= new_x < self.trajectory_overlay.shape[1] and 0 <= new_y < self.trajectory_overlay.shape[0]:
-                    color_at_point = self.trajectory_overlay[new_y, new_x]
-
-                    for traj_id, color in self.color_generator.get_active_colors().items():
-                        if np.linalg.norm(color_at_point.astype(int) - color.astype(int)) < TOLERANCE:
-                            log_info(f"Matched trajectory {traj_id} at offset ({delta_x}, {delta_y})")
-                            return traj_id
-                        
-        log_info("No trajectory found in neighborhood")
-        return None
+        log_info(f"Matched trajectory {traj_id} ({source})")
+        return traj_id
+
+    def get_segment_grid(self):
+        grid_key = (self.current_frame, self.trajectory_manager.version)
+        if self.grid_key != grid_key:
+            polylines = {}
+            for traj_id in self.trajectory_manager.get_active_trajectories(self.current_frame):
+                num_points = self.current_frame - self.trajectory_manager.traj_starts[traj_id] + 1
+                polylines[traj_id] = self.trajectory_manager.point_arrays[traj_id][:num_points]
+            self.segment_grid = SegmentGrid(polylines)
+            self.grid_key = grid_key
+        return self.segment_grid
     
     def highlight_selected_trajectory(self, traj_id):
         log_info(f"Highlighting trajectory {traj_id}")
@@ -109,11 +120,5 @@ class TrajectoryClickHandler(QGraphicsView):
     def refresh_frame_if_paused(self):
         if self.parent().playback_mode == PlaybackMode.STOPPED:
             log_info("[DEBUG] Video is paused, refreshing frame.")
-
-            if self.parent().current_frame < self.parent().total_frames - 1:
-                temp_frame = self.parent().current_frame + 1  
-            else:
-                temp_frame = self.parent().current_frame - 1  
-
-            self.parent().show_frame_at(temp_frame) 
-            self.parent().show_frame_at(self.parent().current_frame) 
+            # THE SELECTION CHANGE DROPS THE FRAME'S CACHED OVERLAY, SHOWING IT AGAIN REDRAWS IT IN PLACE
+            self.parent().show_frame_at(self.parent().current_frame)
@@ -1,4 +1,41 @@
-from utils.logging_utils import log_info
+import numpy as np
+from utils.logging_utils import log_info, log_error
+from .frame_interval_index import FrameIntervalIndex
+
+EDIT_LOG_SIZE = 256 # edits remembered for changed_since(), older versions see a full change
+
+def to_pixel_array(trajectory, width, height, point_scale = (1.0, 1.0)):
+    """Converts trajectory points to an int32 (N, 2) array of pixels in a width x height frame.
+
+    Coordinates <= 1 are normalized, larger ones are pixels in the source
+    resolution and are multiplied by point_scale. The result is clipped to the frame.
+    """
+    points = np.asarray(trajectory, dtype = np.float64).reshape(-1, 2)
+    scale = np.array(point_scale, dtype = np.float64)
+    size = np.array([width, height], dtype = np.float64)
+    normalized = points <= 1
+    pixels = np.where(normalized, np.trunc(points * size), np.round(points * scale))
+    return np.ascontiguousarray(np.clip(pixels, 0, size - 1), dtype = np.int32)
+
+class TrajectorySnapshot:
+    """Copy of the trajectories at one version, read by the overlay render thread.
+
+    The manager is edited on the GUI thread, the snapshot never changes. Point
+    arrays are replaced, never written in place, so they are shared.
+    """
+
+    def __init__(self, manager):
+        self.version = manager.version
+        self.point_arrays = dict(manager.point_arrays)
+        self.traj_starts = dict(manager.traj_starts)
+        self.frame_index = manager.frame_index.copy()
+
+    def get_active_trajectories(self, current_frame):
+        return self.frame_index.at(current_frame)
+
+    def get_active_trajectories_in_range(self, start_frame, end_frame):
+        """Returns the trajectories active at any frame in [start_frame, end_frame)."""
+        return self.frame_index.overlapping(start_frame, end_frame)
 
 class TrajectoryManager:
     def __init__(self, human_config):
@@ -6,11 +43,20 @@ class TrajectoryManager:
         self.trajectories = {}
         self.selected_trajs = []
         self.human_config = human_config
+        self.version = 0 # bumped on every trajectory edit, renderers rebuild what they drew when it changes
+        self.edit_log = [] # (version, edited traj_ids or None when all trajectories changed)
+        self.point_arrays = {} # traj_id -> int32 (N, 2) pixels in the displayed frame, see set_frame_size
+        self.frame_size = None
+        self.point_scale = (1.0, 1.0)
+        self.frame_index = FrameIntervalIndex() # [traj_start, traj_start + len) of every trajectory
+        self.last_snapshot = None
 
     def set_trajectories(self):
         """Assigns trajectories using stored IDs"""
         self.traj_starts = {}
         self.trajectories = {}
+        self.frame_index.clear()
+        self.record_edit()
 
         for humanID in self.human_config.dict.keys():
             traj = self.human_config.get_element(humanID, "trajectories")
@@ -20,11 +66,41 @@ class TrajectoryManager:
                 traj_id = int(humanID.replace("human", ""))
                 self.trajectories[traj_id] = traj
                 self.traj_starts[traj_id] = start
+                self.frame_index.add(traj_id, start, start + len(traj))
+
+        self.update_point_arrays()
+
+    def set_frame_size(self, width, height, source_size = None):
+        """Sets the displayed frame size and converts every trajectory to pixel arrays for it.
+
+        Pixel trajectory points are in the source resolution (source_size), the
+        displayed frame may be smaller (proxy mode).
+        """
+        source_width, source_height = source_size or (width, height)
+        self.frame_size = (width, height)
+        self.point_scale = (width / source_width, height / source_height)
+        self.update_point_arrays()
+        self.record_edit()
+
+    def update_point_arrays(self, traj_ids = None):
+        if self.frame_size is None:
+            return
+        for traj_id in (self.trajectories if traj_ids is None else traj_ids):
+            try:
+                self.point_arrays[traj_id] = to_pixel_array(self.trajectories[traj_id], *self.frame_size, self.point_scale)
+            except (ValueError, TypeError) as e:
+                log_error(f"Invalid points in trajectory {traj_id}: {e}")
+                self.point_arrays[traj_id] = np.zeros((0, 2), dtype = np.int32)
+        if traj_ids is None:
+            self.point_arrays = {traj_id: self.point_arrays[traj_id] for traj_id in self.trajectories}
 
     def add_trajectory(self, new_trajectory, start_frame):
         traj_id = self.human_config.get_newID()
         self.trajectories[traj_id] = new_trajectory
         self.traj_starts[traj_id] = start_frame
+        self.frame_index.add(traj_id, start_frame, start_frame + len(new_trajectory))
+        self.update_point_arrays([traj_id])
+        self.record_edit([traj_id])
 
         self.human_config.set_element(traj_id, "trajectories", new_trajectory)
         self.human_config.set_element(traj_id, "traj_start", start_frame)
@@ -34,16 +110,39 @@ class TrajectoryManager:
         if traj_id in self.trajectories:
             del self.trajectories[traj_id]
             del self.traj_starts[traj_id]
+            self.point_arrays.pop(traj_id, None)
+            self.frame_index.remove(traj_id)
+            self.record_edit([traj_id])
             self.human_config.delete_ID(traj_id)
 
-    def get_active_trajectories(self, current_frame):
-        active_trajectories = []
+    def snapshot(self):
+        """Returns a TrajectorySnapshot of the current version, shared until the next edit."""
+        if self.last_snapshot is None or self.last_snapshot.version != self.version:
+            self.last_snapshot = TrajectorySnapshot(self)
+        return self.last_snapshot
+
+    def record_edit(self, traj_ids = None):
+        self.version += 1
+        self.edit_log.append((self.version, None if traj_ids is None else set(traj_ids)))
+        del self.edit_log[:-EDIT_LOG_SIZE]
 
-        for traj_id, traj_start in self.traj_starts.items():
-            if traj_start <= current_frame < traj_start + len(self.trajectories[traj_id]):  
-                active_trajectories.append(traj_id)
+    def changed_since(self, version):
+        """Returns the ids of the trajectories edited after version, or None if all of them may have changed."""
+        if version == self.version:
+            return set()
+        if not self.edit_log or self.edit_log[0][0] > version + 1:
+            return None
 
-        return active_trajectories
+        changed = set()
+        for edit_version, traj_ids in self.edit_log:
+            if edit_version > version:
+                if traj_ids is None:
+                    return None
+                changed |= traj_ids
+        return changed
+
+    def get_active_trajectories(self, current_frame):
+        return self.frame_index.at(current_frame)
 
     def set_selected_trajectory(self, selected_traj_id):
         if len(self.selected_trajs) < 2:
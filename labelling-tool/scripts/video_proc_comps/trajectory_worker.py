@@ -1,145 +1,261 @@
 import cv2
-import time
 import numpy as np
-from PyQt6.QtCore import QThread, pyqtSignal
+from PyQt6.QtCore import QThread, QMutex, QWaitCondition, pyqtSignal
 from utils.logging_utils import log_info, log_error
+from .cache_stats import prefetch_window
+from .overlay_cache import OverlayCache, DEFAULT_MAX_BYTES as OVERLAY_CACHE_BYTES
+from .pick_buffer import PICK_SHIFT, PICK_THICKNESS, pick_buffer_shape
 
 class TrajectoryWorker(QThread):
-    update_overlay = pyqtSignal(np.ndarray)
+    """Renders trajectory overlays on its own thread.
 
-    def __init__(self, trajectory_manager, color_generator, video_width, video_height, total_frames, video_fps = 30, cache_size = 30):
+    The GUI thread calls request() with the frame it shows. A cached overlay is
+    returned right away, otherwise the worker renders it and emits
+    update_overlay(overlay, frame_number). Only the latest request is kept, and
+    after it the worker preloads the next frames along the playback step.
+    Edits happen on the GUI thread, so the worker only reads the
+    TrajectorySnapshot and selection handed over with the latest request.
+    """
+
+    update_overlay = pyqtSignal(np.ndarray, int)
+
+    def __init__(self, trajectory_manager, color_generator, video_width, video_height, total_frames, video_fps = 30, prefetch_frames = 30, cache_bytes = OVERLAY_CACHE_BYTES):
         super().__init__()
         self.running = True
         self.frame_number = -1
-        self.overlay_cache = {} 
+        self.step = 1 # playback step of the last request, negative while rewinding
+        self.generation = 0 # bumped by every request, the worker drops stale work
+        self.pending_emit = False # the GUI is waiting for the overlay of frame_number
+        self.mutex = QMutex()
+        self.condition = QWaitCondition()
+        self.overlay_cache = OverlayCache(max_bytes = cache_bytes)
         self.video_fps = video_fps
-        self.cache_size = cache_size  # Buffer only 30 frames (~1 sec)
+        self.prefetch_window = prefetch_window(prefetch_frames, cache_bytes, video_width * video_height * 3)
         self.video_width = video_width
         self.total_frames = total_frames
         self.video_height = video_height
         self.color_generator = color_generator
         self.trajectory_manager = trajectory_manager
 
-        self.colors = None
+        # INCREMENTAL LINE AND PICK LAYERS, ONLY TOUCHED BY THE WORKER THREAD
+        self.line_layer = None
+        self.pick_layer = None # int32, traj_id + 1 on the drawn lines at half resolution
+        self.line_layer_frame = -1
+        self.line_layer_state = None
+        self.drawn_points = {} # traj_id -> number of points drawn into the line layer
+        self.rebuilds = 0 # full redraws of the layers, logged with the overlay cache stats
+        self.blank_overlay = None # shared by the preloaded frames of windows without trajectories
+        self.blank_pick_buffer = None
+
+        # TRAJECTORY VERSION AND SELECTION THE CACHED OVERLAYS WERE DRAWN WITH, SYNCED ON THE GUI THREAD
+        self.cache_version = trajectory_manager.version
+        self.cache_selection = set(trajectory_manager.get_selected_trajectory())
+
+        # TRAJECTORIES AND SELECTION TO RENDER WITH, REPLACED UNDER THE MUTEX BY request()
+        self.snapshot = trajectory_manager.snapshot()
+        self.selection = tuple(trajectory_manager.get_selected_trajectory())
+
+    def request(self, frame_number, step = 0):
+        """Asks for the overlay of frame_number, step is the playback step (0 keeps the last direction).
+
+        Returns the cached overlay, or None if it is being rendered and will
+        arrive through update_overlay.
+        """
+        self.mutex.lock()
+        # EDITS AND SELECTION CHANGES HAPPEN ON THE GUI THREAD, DROP WHAT THEY MADE STALE BEFORE THE LOOKUP
+        self._sync_cache()
+        self.snapshot = self.trajectory_manager.snapshot()
+        self.selection = tuple(self.trajectory_manager.get_selected_trajectory())
+        self.overlay_cache.set_playhead(frame_number, step)
+        overlay = self.overlay_cache.get(frame_number)
+
+        self.frame_number = frame_number
+        if step:
+            self.step = step
+        self.pending_emit = overlay is None
+        self.generation += 1
+        self.condition.wakeOne()
+        self.mutex.unlock()
+        return overlay
 
     def run(self):
-        """Runs the thread and updates overlay when frame changes."""
-        last_frame = -1  
+        """Waits for requests, renders the requested overlay if needed and preloads the next ones."""
+        generation = 0
 
-        while self.running:
-            if self.frame_number < 0 or self.frame_number == last_frame:
-                time.sleep(1 / self.video_fps)  
-                continue
-            last_frame = self.frame_number  
+        while True:
+            self.mutex.lock()
+            while self.running and self.generation == generation:
+                self.condition.wait(self.mutex)
+            running, generation = self.running, self.generation
+            frame_number, step, pending_emit = self.frame_number, self.step, self.pending_emit
+            snapshot, selection = self.snapshot, self.selection
+            self.mutex.unlock()
 
-            if self.frame_number in self.overlay_cache:
-                overlay = self.overlay_cache[self.frame_number]
-            else:
-                overlay = self._generate_overlay(self.frame_number)
-                self.overlay_cache[self.frame_number] = overlay
+            if not running:
+                break
 
-            self.update_overlay.emit(overlay)
-            self._preload_future_frames(self.frame_number)
+            try:
+                if pending_emit:
+                    overlay = self.overlay_cache.peek(frame_number)
+                    if overlay is None:
+                        overlay = self._render_overlay(frame_number, snapshot, selection)
+                    self.update_overlay.emit(overlay, frame_number)
+                self._preload_frames(frame_number, step, generation, snapshot, selection)
+            except Exception as e:
+                log_error(f"TrajectoryWorker failed near frame {frame_number}: {e}")
 
-    def _generate_overlay(self, frame_number):
-        """Generates trajectory overlay and labels for a frame."""
-        overlay = np.zeros((self.video_height, self.video_width, 3), dtype = np.uint8)
-        active_trajectories = self.trajectory_manager.get_active_trajectories(frame_number)
-        highlighted_trajs = self.trajectory_manager.get_selected_trajectory()
+    def _render_overlay(self, frame_number, snapshot, selection):
+        """Generates an overlay and caches it, unless a newer snapshot or selection was handed over meanwhile."""
+        overlay, pick_buffer = self._generate_overlay(frame_number, snapshot, selection)
+        self._cache_overlay(frame_number, overlay, snapshot.get_active_trajectories(frame_number), pick_buffer, snapshot, selection)
+        return overlay
 
-        log_info(f"Active Trajectories: {active_trajectories}")
-        log_info(f"Highlighted Trajectory: {highlighted_trajs}")
+    def _cache_overlay(self, frame_number, overlay, traj_ids, pick_buffer, snapshot, selection):
+        # CHECKED AND CACHED UNDER THE MUTEX, request() CANNOT INVALIDATE THE CACHE IN BETWEEN
+        self.mutex.lock()
+        if self.snapshot is snapshot and self.selection == selection:
+            self.overlay_cache.put(frame_number, overlay, traj_ids, pick_buffer)
+        self.mutex.unlock()
 
-        for traj_id in active_trajectories:
-            if traj_id not in active_trajectories:
-                continue
+    def _sync_cache(self):
+        """Drops the cached overlays of the trajectories edited, selected or unselected since the last sync, on the GUI thread."""
+        version = self.trajectory_manager.version
+        if version != self.cache_version:
+            changed = self.trajectory_manager.changed_since(self.cache_version)
+            self.cache_version = version
+            if changed is None:
+                self.overlay_cache.clear()
+            else:
+                self.overlay_cache.invalidate(changed)
+                # A NEW TRAJECTORY IS NOT IN THE OVERLAYS OF ITS FRAMES YET
+                for traj_id in changed & self.trajectory_manager.traj_starts.keys():
+                    start = self.trajectory_manager.traj_starts[traj_id]
+                    self.overlay_cache.invalidate_range(start, start + len(self.trajectory_manager.trajectories[traj_id]))
 
-            traj = self.trajectory_manager.trajectories[traj_id]
-            traj_start = self.trajectory_manager.traj_starts[traj_id]
-            frame_offset = frame_number - traj_start
+        selection = set(self.trajectory_manager.get_selected_trajectory())
+        if selection != self.cache_selection:
+            self.overlay_cache.invalidate(selection ^ self.cache_selection)
+            self.cache_selection = selection
 
-            if frame_offset < 0 or frame_offset >= len(traj):
-                continue
+    def _generate_overlay(self, frame_number, snapshot, highlighted_trajs):
+        """Generates the trajectory overlay with labels and the pick buffer of a frame.
+
+        The lines live in persistent layers, the RGB one and a half-resolution
+        int32 one holding the trajectory ids for click picking. When frame_number is after the
+        frame the layer was drawn for, only the new segments of each trajectory
+        are drawn and the trajectories that ended are erased. Going backwards,
+        selection changes and trajectory edits rebuild it. The labels are put
+        on a copy.
+        """
+        active_trajectories = snapshot.get_active_trajectories(frame_number)
+        layer_state = (snapshot.version, highlighted_trajs)
+        if self.line_layer is None or frame_number <= self.line_layer_frame or self.line_layer_state != layer_state:
+            self.line_layer = np.zeros((self.video_height, self.video_width, 3), dtype = np.uint8)
+            self.pick_layer = np.zeros(pick_buffer_shape(self.video_width, self.video_height), dtype = np.int32)
+            self.line_layer_state = layer_state
+            self.drawn_points = {}
+            self.rebuilds += 1
 
+        ended = [traj_id for traj_id in self.drawn_points if traj_id not in active_trajectories]
+        if ended:
+            self._erase_trajectories(ended, snapshot, highlighted_trajs)
+
+        for traj_id in active_trajectories:
+            points = snapshot.point_arrays[traj_id]
+            num_points = min(len(points), frame_number - snapshot.traj_starts[traj_id] + 1)
             try:
-                active_traj = traj[: max(1, frame_offset + 1)]
-                color = self.color_generator.get_color(traj_id)
-
-                if traj_id in highlighted_trajs: 
-                    highlighted_color = np.array([0, 255, 0], dtype = np.uint8) 
-                    log_info(f"[DEBUG] Drawing trajectory {traj_id} with HIGHLIGHT color {highlighted_color.tolist()}")
-                else:
-                    highlighted_color = np.array(color, dtype = np.uint8)
-                    log_info(f"[DEBUG] Drawing trajectory {traj_id} with NORMAL color {highlighted_color.tolist()}")
-
-                if len(active_traj) > 1:
-                    for j in range(len(active_traj) - 1):
-                        pt1 = self.scale_point(active_traj[j])
-                        pt2 = self.scale_point(active_traj[j + 1])
-                        cv2.line(overlay, pt1, pt2, highlighted_color.tolist(), 4)
-                        
-                        last_point = self.scale_point(active_traj[-1])
-                        cv2.putText(overlay, str(traj_id + 1), last_point, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 146, 35), 1, lineType = cv2.LINE_AA)
+                self._draw_segments(traj_id, points, self.drawn_points.get(traj_id, 0), num_points, self._line_color(traj_id, highlighted_trajs))
+                self.drawn_points[traj_id] = num_points
             except Exception as e:
                 log_error(f"Error processing trajectory {traj_id} at frame {frame_number}: {e}")
 
-        log_info(f"[DEBUG] Returning overlay for frame {frame_number}, np.sum: {np.sum(overlay)}")
-        return overlay
-    
-    def _preload_future_frames(self, current_frame):
-        """Preloads a rolling buffer of future frames"""
-        selected_trajectory = self.trajectory_manager.get_selected_trajectory()
-
-        # If a trajectory is selected, stop preloading and clear outdated preloaded frames
-        if selected_trajectory is not None:
-            log_info("[DEBUG] Preloading halted due to active selection.")
-            self.overlay_cache.clear() 
-            return  
-
-        max_preload = min(self.total_frames, current_frame + self.cache_size)
-
-        for frame_idx in range(current_frame + 1, max_preload):
-            if frame_idx not in self.overlay_cache:
-                self.overlay_cache[frame_idx] = self._generate_overlay(frame_idx)
-
-        # Keep only the most recent cache_size frames
-        keys = list(self.overlay_cache.keys())
-        if len(keys) > self.cache_size:
-            for key in keys[:-self.cache_size]:  
-                del self.overlay_cache[key]
-
-        log_info(f"[DEBUG] Preloaded frames up to {max_preload}, current frame: {current_frame}")
-
-    def scale_point(self, point):
-        try:
-            x, y = point
-            scaled_x = int(x * self.video_width) if x <= 1 else int(round(x))
-            scaled_y = int(y * self.video_height) if y <= 1 else int(round(y))
-            return max(0, min(self.video_width - 1, scaled_x)), max(0, min(self.video_height - 1, scaled_y))
-        except Exception as e:
-            log_error(f"Error scaling point {point}: {e}")
-            return (0, 0)
-
-    def update_frame(self, frame_number):
-        """Ensures the thread starts only if necessary."""
-        if self.frame_number == frame_number:
+        self.line_layer_frame = frame_number
+        overlay = self.line_layer.copy()
+        pick_buffer = self.pick_layer.copy()
+
+        for traj_id, num_points in self.drawn_points.items():
+            if num_points > 1:
+                last_point = tuple(int(c) for c in snapshot.point_arrays[traj_id][num_points - 1])
+                cv2.putText(overlay, str(traj_id + 1), last_point, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 146, 35), 1, lineType = cv2.LINE_AA)
+
+        return overlay, pick_buffer
+
+    def _line_color(self, traj_id, highlighted_trajs):
+        if traj_id in highlighted_trajs:
+            return [0, 255, 0]
+        return np.array(self.color_generator.get_color(traj_id), dtype = np.uint8).tolist()
+
+    def _draw_segments(self, traj_id, points, first_point, num_points, color, layer = None):
+        """Draws the segments ending at points first_point .. num_points - 1 into the line and pick layers.
+
+        With layer, the segments are only drawn into it, in the given color.
+        """
+        segment = points[max(0, first_point - 1):num_points]
+        if len(segment) < 2:
             return
-        
-        log_info(f"[DEBUG] Updating frame to {frame_number}")
-        self.frame_number = frame_number
+        if layer is not None:
+            cv2.polylines(layer, [segment], False, color, 4)
+            return
+
+        cv2.polylines(self.line_layer, [segment], False, color, 4)
+        # shift = PICK_SHIFT DIVIDES THE POINTS, DRAWING THEM AT THE PICK LAYER'S RESOLUTION
+        cv2.polylines(self.pick_layer, [segment], False, traj_id + 1, PICK_THICKNESS, shift = PICK_SHIFT)
+
+    def _erase_trajectories(self, ended, snapshot, highlighted_trajs):
+        """Blacks out the ended trajectories and redraws the remaining ones crossing the erased area."""
+        erased = np.zeros(self.line_layer.shape[:2], dtype = np.uint8)
+        for traj_id in ended:
+            points = snapshot.point_arrays.get(traj_id)
+            num_points = self.drawn_points.pop(traj_id)
+            if points is not None:
+                self._draw_segments(traj_id, points, 0, num_points, 255, layer = erased)
+
+        x, y, w, h = cv2.boundingRect(erased)
+        if w == 0 or h == 0:
+            return
+        self.line_layer[erased > 0] = 0
+        pick_ids = np.array([traj_id + 1 for traj_id in ended], dtype = np.int32)
+        top, left = max(0, (y >> PICK_SHIFT) - 1), max(0, (x >> PICK_SHIFT) - 1)
+        pick_region = self.pick_layer[top:((y + h) >> PICK_SHIFT) + 2, left:((x + w) >> PICK_SHIFT) + 2]
+        pick_region[np.isin(pick_region, pick_ids)] = 0
 
-        if frame_number in self.overlay_cache:
-            overlay = self.overlay_cache[frame_number]
-        else:
-            overlay = self._generate_overlay(frame_number)
-            self.overlay_cache[frame_number] = overlay
+        for traj_id, num_points in self.drawn_points.items():
+            points = snapshot.point_arrays[traj_id]
+            px, py, pw, ph = cv2.boundingRect(points[:num_points])
+            if px <= x + w + 4 and x <= px + pw + 4 and py <= y + h + 4 and y <= py + ph + 4:
+                self._draw_segments(traj_id, points, 0, num_points, self._line_color(traj_id, highlighted_trajs))
 
-        self.update_overlay.emit(overlay)
+    def _preload_frames(self, current_frame, step, generation, snapshot, selection):
+        """Renders the overlays of the next frames along the playback direction and speed.
+
+        If no trajectory is active anywhere in the window, nothing is rendered
+        and its frames share one blank overlay.
+        """
+        first, last = current_frame + step, current_frame + self.prefetch_window * step
+        window_trajs = snapshot.get_active_trajectories_in_range(max(0, min(first, last)), min(self.total_frames, max(first, last) + 1))
+        if not window_trajs and self.blank_overlay is None:
+            self.blank_overlay = np.zeros((self.video_height, self.video_width, 3), dtype = np.uint8)
+            self.blank_pick_buffer = np.zeros(pick_buffer_shape(self.video_width, self.video_height), dtype = np.int32)
+
+        for i in range(1, self.prefetch_window + 1):
+            frame_idx = current_frame + i * step
+            if not 0 <= frame_idx < self.total_frames:
+                break
+            # STOP AS SOON AS A NEWER REQUEST ARRIVES, THE NEXT PASS STARTS FROM ITS FRAME
+            if self.generation != generation:
+                return
+            if frame_idx in self.overlay_cache:
+                continue
+            if window_trajs:
+                self._render_overlay(frame_idx, snapshot, selection)
+            else:
+                self._cache_overlay(frame_idx, self.blank_overlay, (), self.blank_pick_buffer, snapshot, selection)
 
     def stop(self):
         """Gracefully stops the thread."""
-        if self.isRunning():  
-            self.running = False
-            self.wait()  
-            self.quit()
+        self.mutex.lock()
+        self.running = False
+        self.condition.wakeOne()
+        self.mutex.unlock()
+        self.wait()
         log_info("TrajectoryWorker stopped.")
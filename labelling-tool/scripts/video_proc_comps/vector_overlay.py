@@ -0,0 +1,100 @@
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QPen, QBrush, QColor, QFont, QPainterPath
+from PyQt6.QtWidgets import QGraphicsPathItem, QGraphicsSimpleTextItem
+
+HIGHLIGHT_COLOR = (0, 255, 0)
+LABEL_COLOR = (255, 146, 35)
+LINE_WIDTH = 4
+
+class VectorTrajectoryOverlay:
+    """Draws trajectories as QGraphicsPathItems in the scene instead of a raster overlay.
+
+    Every trajectory keeps one path item and one label item. update() only
+    appends the points reached since the last frame, or rebuilds a path when
+    playback moved backwards, and a selection change only swaps the pen.
+    Points come from the manager's pixel arrays (TrajectoryManager.point_arrays).
+    """
+
+    def __init__(self, scene, trajectory_manager, color_generator, z_value = 1):
+        self.scene = scene
+        self.trajectory_manager = trajectory_manager
+        self.color_generator = color_generator
+        self.z_value = z_value
+        self.items = {} # traj_id -> [path_item, label_item, drawn points]
+        self.version = trajectory_manager.version
+
+    def update(self, frame_number):
+        """Shows the trajectories active at frame_number, drawn up to that frame."""
+        active = set(self.trajectory_manager.get_active_trajectories(frame_number))
+        selected = self.trajectory_manager.get_selected_trajectory()
+
+        if self.version != self.trajectory_manager.version:
+            changed = self.trajectory_manager.changed_since(self.version)
+            self.version = self.trajectory_manager.version
+            for traj_id in (list(self.items) if changed is None else changed):
+                self.invalidate(traj_id)
+        for traj_id in list(self.items):
+            if traj_id not in self.trajectory_manager.trajectories:
+                self.invalidate(traj_id)
+            elif traj_id not in active:
+                self.set_visible(traj_id, False)
+
+        for traj_id in active:
+            points = self.trajectory_manager.point_arrays[traj_id]
+            num_points = min(len(points), frame_number - self.trajectory_manager.traj_starts[traj_id] + 1)
+            self.draw(traj_id, points, num_points, traj_id in selected)
+
+    def draw(self, traj_id, points, num_points, highlighted):
+        if traj_id not in self.items:
+            path_item = QGraphicsPathItem()
+            path_item.setZValue(self.z_value)
+            label_item = QGraphicsSimpleTextItem(str(traj_id + 1))
+            label_item.setBrush(QBrush(QColor(*LABEL_COLOR)))
+            label_item.setFont(QFont("Sans", 9))
+            label_item.setZValue(self.z_value)
+            self.scene.addItem(path_item)
+            self.scene.addItem(label_item)
+            self.items[traj_id] = [path_item, label_item, 0]
+
+        entry = self.items[traj_id]
+        path_item, label_item, drawn = entry
+
+        if num_points < drawn or drawn == 0:
+            # MOVED BACKWARDS (OR FIRST DRAW), REBUILD THE PATH UP TO THE CURRENT POINT
+            path = QPainterPath(QPointF(*points[0].tolist()))
+            drawn = 1
+        else:
+            path = path_item.path()
+        for x, y in points[drawn:num_points].tolist():
+            path.lineTo(QPointF(x, y))
+        if num_points != entry[2]:
+            path_item.setPath(path)
+            entry[2] = num_points
+
+        color = HIGHLIGHT_COLOR if highlighted else tuple(int(c) for c in self.color_generator.get_color(traj_id))
+        if path_item.pen().color() != QColor(*color) or path_item.pen().width() != LINE_WIDTH:
+            pen = QPen(QColor(*color), LINE_WIDTH)
+            pen.setCapStyle(Qt.PenCapStyle.RoundCap)
+            pen.setJoinStyle(Qt.PenJoinStyle.RoundJoin)
+            path_item.setPen(pen)
+
+        # LIKE THE RASTER OVERLAY, A SINGLE POINT DRAWS NOTHING
+        last_x, last_y = points[num_points - 1].tolist()
+        label_item.setPos(last_x, last_y - label_item.boundingRect().height())
+        self.set_visible(traj_id, num_points > 1)
+
+    def set_visible(self, traj_id, visible):
+        path_item, label_item, _ = self.items[traj_id]
+        path_item.setVisible(visible)
+        label_item.setVisible(visible)
+
+    def invalidate(self, traj_id):
+        """Drops the items of a trajectory, it is redrawn from its first point on the next update."""
+        if traj_id in self.items:
+            path_item, label_item, _ = self.items.pop(traj_id)
+            self.scene.removeItem(path_item)
+            self.scene.removeItem(label_item)
+
+    def clear(self):
+        for traj_id in list(self.items):
+            self.invalidate(traj_id)
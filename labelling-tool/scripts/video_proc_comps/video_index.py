@@ -0,0 +1,129 @@
+import os
+import cv2
+import json
+import bisect
+from utils.logging_utils import log_info, log_warning
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index.json" # sidecar next to the video
+PROGRESS_STEP = 100 # frames between two progress callbacks
+
+class VideoIndex:
+    """Exact frame count, per-frame timestamps and keyframe positions of a video.
+
+    Built once per video by reading its packets without decoding them, and cached
+    in a sidecar JSON next to it. The cache is rebuilt when the video's size or
+    mtime changes. If the packets cannot be read the whole file is decoded to
+    count the frames, and keyframes stays empty.
+    """
+
+    def __init__(self, frame_count, fps, timestamps, keyframes):
+        self.frame_count = frame_count
+        self.fps = fps
+        self.timestamps = timestamps # seconds, in display order
+        self.keyframes = keyframes # sorted frame indices
+
+    def keyframe_before(self, frame_number):
+        """Returns the last keyframe at or before frame_number, or None if no keyframes are known."""
+        pos = bisect.bisect_right(self.keyframes, frame_number)
+        return self.keyframes[pos - 1] if pos else None
+
+    def frame_at(self, timestamp):
+        """Returns the frame whose timestamp is closest to the given one (seconds)."""
+        pos = bisect.bisect_left(self.timestamps, timestamp)
+        if pos == len(self.timestamps) or (pos > 0 and timestamp - self.timestamps[pos - 1] < self.timestamps[pos] - timestamp):
+            pos -= 1
+        return max(pos, 0)
+
+    def to_dict(self):
+        return {"frame_count": self.frame_count, "fps": self.fps, "timestamps": self.timestamps, "keyframes": self.keyframes}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["frame_count"], data["fps"], data["timestamps"], data["keyframes"])
+
+def file_signature(video_path):
+    stat = os.stat(video_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def scan_packets(video_path, progress = None):
+    """Reads the video packets without decoding them (OpenCV raw stream mode).
+
+    Returns the display-order timestamps and the keyframe positions, or None if
+    the backend cannot hand out raw packets.
+    """
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+    if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+        cap.release()
+        return None
+
+    estimated_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    packets = []
+    try:
+        while cap.grab():
+            packets.append((cap.get(cv2.CAP_PROP_POS_MSEC) / 1000, bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME))))
+            if progress is not None and len(packets) % PROGRESS_STEP == 0:
+                progress(len(packets), estimated_total)
+    finally:
+        cap.release()
+
+    # PACKETS COME IN DECODE ORDER, SORTING BY TIMESTAMP GIVES THE DISPLAY ORDER
+    packets.sort()
+    return [pts for pts, _ in packets], [idx for idx, (_, is_key) in enumerate(packets) if is_key]
+
+def scan_frames(video_path, progress = None):
+    """Decodes the whole video and returns the timestamp of every frame."""
+    cap = cv2.VideoCapture(video_path)
+    estimated_total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    timestamps = []
+    try:
+        while cap.grab():
+            timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+            if progress is not None and len(timestamps) % PROGRESS_STEP == 0:
+                progress(len(timestamps), estimated_total)
+    finally:
+        cap.release()
+    return timestamps
+
+def build_index(video_path, progress = None):
+    """Scans the video into a VideoIndex, calling progress(frames_scanned, estimated_total) along the way."""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+
+    scan = scan_packets(video_path, progress)
+    if scan is not None:
+        timestamps, keyframes = scan
+    else:
+        log_warning(f"Cannot read raw packets of {video_path}, decoding it to count its frames (keyframes unknown).")
+        timestamps, keyframes = scan_frames(video_path, progress), []
+
+    return VideoIndex(len(timestamps), fps, timestamps, keyframes)
+
+def load_video_index(video_path, progress = None):
+    """Returns the VideoIndex of a video from its sidecar, scanning and caching it when missing or stale."""
+    index_path = f"{video_path}{INDEX_SUFFIX}"
+    signature = file_signature(video_path)
+
+    try:
+        with open(index_path, "r") as index_file:
+            data = json.load(index_file)
+        if data.get("version") == INDEX_VERSION and data.get("signature") == signature:
+            return VideoIndex.from_dict(data)
+        log_info(f"Video index {index_path} is stale, rebuilding.")
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError) as e:
+        log_warning(f"Ignoring unreadable video index {index_path}: {e}")
+
+    index = build_index(video_path, progress)
+    log_info(f"Indexed {video_path}: {index.frame_count} frames, {len(index.keyframes)} keyframes")
+
+    try:
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w") as index_file:
+            json.dump({"version": INDEX_VERSION, "signature": signature, **index.to_dict()}, index_file)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        log_warning(f"Cannot write video index {index_path}: {e}")
+    return index
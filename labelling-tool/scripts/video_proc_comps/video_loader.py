@@ -0,0 +1,55 @@
+from .proxy import load_proxy
+from .video_index import load_video_index
+from utils.logging_utils import log_info, log_error
+from PyQt6.QtCore import QThread, pyqtSignal
+
+class LoadCancelled(Exception):
+    pass
+
+class VideoLoadWorker(QThread):
+    """Prepares a video for playback off the GUI thread.
+
+    Transcodes the proxy (in proxy mode) and scans the VideoIndex, both of which
+    decode the whole file the first time a video is loaded and are read from
+    their sidecars afterwards. Emits progress messages while working and
+    loaded(path, playback_path, index) when done, with index None if it failed.
+    """
+
+    progress = pyqtSignal(str)
+    loaded = pyqtSignal(str, str, object)
+
+    def __init__(self, video_path, use_proxy = False):
+        super().__init__()
+        self.video_path = video_path
+        self.use_proxy = use_proxy
+        self.running = True
+
+    def report(self, step, done, total):
+        """Progress callback of load_proxy and load_video_index, raising LoadCancelled once stop() is called."""
+        if not self.running:
+            raise LoadCancelled()
+        self.progress.emit(f"{step}: {done}/{total} frames" if total > 0 else f"{step}: {done} frames")
+
+    def run(self):
+        playback_path, index = self.video_path, None
+        try:
+            # PROXY MODE PLAYS A DOWNSCALED ALL-INTRA COPY, FALLING BACK TO THE ORIGINAL IF IT CANNOT BE MADE
+            if self.use_proxy:
+                self.progress.emit("Preparing proxy")
+                playback_path = load_proxy(self.video_path, progress = lambda done, total: self.report("Building proxy", done, total)) or self.video_path
+
+            self.progress.emit("Indexing frames")
+            index = load_video_index(playback_path, progress = lambda done, total: self.report("Indexing frames", done, total))
+        except LoadCancelled:
+            log_info(f"Loading {self.video_path} cancelled.")
+            return
+        except Exception as e:
+            log_error(f"Failed to prepare {self.video_path}: {e}")
+
+        if self.running:
+            self.loaded.emit(self.video_path, playback_path, index)
+
+    def stop(self):
+        """Cancels the preparation and waits for the thread to finish."""
+        self.running = False
+        self.wait()
@@ -2,9 +2,15 @@ import cv2
 import time
 import numpy as np
 from PyQt6.QtCore import Qt, QTimer
+from .frame_reader import FrameReader
+from .video_loader import VideoLoadWorker
+from .decode_worker import DecodeWorker, PREFETCH_WINDOW
+from .frame_cache import FrameCache, DEFAULT_MAX_BYTES
+from .cache_stats import prefetch_window
 from .playback_mode import PlaybackMode
 from PyQt6.QtGui import QPixmap, QImage, QIcon
 from .trajectory_worker import TrajectoryWorker
+from .vector_overlay import VectorTrajectoryOverlay
 from .trajectory_manager import TrajectoryManager
 from utils.human_config_utils import HumanConfigUtils
 from .trajectory_click_handler import TrajectoryClickHandler
@@ -15,14 +21,40 @@ from PyQt6.QtWidgets import (
     QGraphicsScene, QGraphicsPixmapItem, QVBoxLayout, QWidget, QMessageBox, QSizePolicy, QApplication
 )
 
+def overlay_bounds(overlay):
+    """Returns the (x1, y1, x2, y2) bounding rect of the non-zero overlay pixels, or None if it is empty."""
+    if overlay is None:
+        return None
+
+    # ONE PASS OVER THE OVERLAY SEEN AS A SINGLE-CHANNEL (H, W * 3) IMAGE
+    height, width, channels = overlay.shape
+    x, y, w, h = cv2.boundingRect(overlay.reshape(height, width * channels))
+    if w == 0 or h == 0:
+        return None
+    return x // channels, y, -(-(x + w) // channels), y + h
+
+OVERLAY_BACKENDS = ("raster", "vector")
+
 class VideoPlayer(QWidget):
-    def __init__(self, video_controls, resource_manager):
+    def __init__(self, video_controls, resource_manager, frame_cache_bytes = DEFAULT_MAX_BYTES, use_proxy = False, overlay_backend = "raster"):
         super().__init__()
         self.cap = None
         self.video_fps = 30  
-        self.video_width = 0
+        self.video_width = 0 # size of the played frames, the proxy's in proxy mode
         self.video_height = 0
-        self.frame_cache = {}
+        self.source_width = 0 # size of the original video, the space trajectories are stored in
+        self.source_height = 0
+        self.use_proxy = use_proxy
+        if overlay_backend not in OVERLAY_BACKENDS:
+            raise ValueError(f"Unknown overlay backend {overlay_backend!r}, expected one of {OVERLAY_BACKENDS}")
+        # RASTER BLENDS A WORKER-DRAWN IMAGE ONTO EVERY FRAME, VECTOR KEEPS ONE PATH ITEM PER TRAJECTORY IN THE SCENE
+        self.overlay_backend = overlay_backend
+        self.vector_overlay = None
+        self.video_loader = None
+        self.playback_path = None
+        self.frame_cache = FrameCache(max_bytes = frame_cache_bytes)
+        self.frame_reader = None
+        self.current_frame = 0
         self.total_frames = 0  
         self.video_path = None
         self.human_config = None
@@ -30,6 +62,11 @@ class VideoPlayer(QWidget):
         self.video_controls = video_controls
         self.resource_manager = resource_manager
         self.playback_mode = PlaybackMode.STOPPED 
+        self.overlay_rect = None
+        self.display_buffer = None
+        self.shown_frame = None # last frame passed to display_frame, shown again when its overlay arrives
+        self.displayed_size = None
+        self.render_stats = {"frames": 0, "total_ms": 0.0, "max_ms": 0.0, "allocations": 0}
         self.color_generator = TrajectoryColorGenerator()
 
         self.human_config_path = self.resource_manager.get_human_config()
@@ -41,6 +78,7 @@ class VideoPlayer(QWidget):
         # TIMERS
         self.timer = QTimer()
         self.playback_speed = 1  
+        self.playback_step = 1 # frames per tick, negative while rewinding, the overlay prefetch follows it
         self.timer.timeout.connect(self.update_frame)
 
         # GRAPHICS SCENE
@@ -61,7 +99,10 @@ class VideoPlayer(QWidget):
         self.setLayout(layout)
     
     def load_video(self, path):
-        """Loads the video file and initializes the UI elements."""
+        """Starts preparing the video file on a VideoLoadWorker, finish_loading then initializes the UI elements.
+
+        The current video stays shown, paused, until the new one is ready.
+        """
         if not is_valid_video_file(path):
             log_warning(f"Attempted to load invalid video file: {path}")
             QMessageBox.warning(self, "Invalid File", "The selected file is not a valid video format.")
@@ -70,11 +111,37 @@ class VideoPlayer(QWidget):
         file_size = get_file_size(path)
         log_info(f"Loading video: {path} (Size: {file_size})")
 
+        if self.video_loader is not None:
+            self.video_loader.stop()
+        self.pause()
+        self.video_controls.play_pause_button.setIcon(QIcon(self.resource_manager.get_icon("play", "play-60")))
+        self.video_controls.upload_button.setEnabled(False)
+
+        # THE PROXY TRANSCODE AND THE FRAME SCAN DECODE THE WHOLE FILE ON FIRST LOAD, KEEP THEM OFF THE GUI THREAD
+        self.video_loader = VideoLoadWorker(path, use_proxy = self.use_proxy)
+        self.video_loader.progress.connect(self.video_controls.status_label.setText)
+        self.video_loader.loaded.connect(self.finish_loading)
+        QApplication.instance().aboutToQuit.connect(self.video_loader.stop)
+        self.video_loader.start()
+
+    def finish_loading(self, path, playback_path, index):
+        """Opens the video prepared by the VideoLoadWorker and initializes the UI elements."""
+        if self.sender() is not self.video_loader:
+            return # a newer load_video replaced this worker
+        self.video_loader = None
+        self.video_controls.status_label.clear()
+        self.video_controls.upload_button.setEnabled(True)
+
+        if index is None:
+            QMessageBox.warning(self, "Error", f"Failed to prepare video file {path}")
+            return
+
         if self.cap:
             self.cap.release()  
 
         self.video_path = path
-        self.cap = cv2.VideoCapture(path)
+        self.playback_path = playback_path
+        self.cap = cv2.VideoCapture(self.playback_path)
 
         if not self.cap.isOpened():
             log_error(f"Failed to open video file: {path}")
@@ -83,18 +150,38 @@ class VideoPlayer(QWidget):
 
         self.video_fps = int(self.cap.get(cv2.CAP_PROP_FPS)) 
         self.video_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
         self.video_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-        log_info(f"Video Loaded: {path} | FPS: {self.video_fps} | Resolution: {self.video_width}x{self.video_height} | Total Frames: {self.total_frames}")
+        self.source_width, self.source_height = self.video_width, self.video_height
+        if self.playback_path != path:
+            source = cv2.VideoCapture(path)
+            self.source_width = int(source.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.source_height = int(source.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            source.release()
+
+        # EXACT FRAME COUNT AND KEYFRAMES, CAP_PROP_FRAME_COUNT IS ONLY AN ESTIMATE FROM THE CONTAINER
+        self.video_index = index
+        self.total_frames = self.video_index.frame_count
+        if self.total_frames <= 0:
+            log_warning(f"Invalid frame count for {path}")
+
+        # THE STATS OF THE PREVIOUS VIDEO ARE LOGGED BEFORE ITS READER AND CACHE ARE REPLACED
+        self.log_cache_stats()
+        self.frame_reader = FrameReader(self.cap, index = self.video_index)
+
+        log_info(f"Video Loaded: {path} | FPS: {self.video_fps} | Resolution: {self.source_width}x{self.source_height} | Playback: {self.playback_path} at {self.video_width}x{self.video_height} | Total Frames: {self.total_frames}")
         self.frame_cache.clear()
+        self.frame_cache.reset_stats()
+        self.render_stats = {"frames": 0, "total_ms": 0.0, "max_ms": 0.0, "allocations": 0}
+        self.displayed_size = None
 
         self.video_controls.max_frame_label.setText(str(self.total_frames))
-        self.video_controls.frame_slider.setRange(0, self.total_frames)
+        self.video_controls.frame_slider.setRange(0, self.total_frames - 1)
 
         if hasattr(self, "trajectory_worker"):
             self.trajectory_worker.stop()
-            self.trajectory_worker.wait()
+
+        # TRAJECTORIES ARE CONVERTED ONCE TO INT32 PIXEL ARRAYS OF THE PLAYED FRAME SIZE
+        self.trajectory_manager.set_frame_size(self.video_width, self.video_height, (self.source_width, self.source_height))
 
         self.trajectory_worker = TrajectoryWorker(
             self.trajectory_manager,
@@ -103,13 +190,28 @@ class VideoPlayer(QWidget):
             self.video_height,  
             self.total_frames,  
             self.video_fps,
-            cache_size = 30 # Preload next 30 frames only
+            prefetch_frames = 30 # Preload next 30 frames only
         )
         self.trajectory_worker.update_overlay.connect(self.update_trajectory_overlay)
+        self.view.overlay_cache = self.trajectory_worker.overlay_cache if self.overlay_backend == "raster" else None
+        QApplication.instance().aboutToQuit.connect(self.trajectory_worker.stop)
         self.trajectory_worker.start() 
 
-        self.trajectory_overlay = np.zeros((self.video_height, self.video_width, 3), dtype = np.uint8)
-        self.view.trajectory_overlay = self.trajectory_overlay
+        if self.vector_overlay is not None:
+            self.vector_overlay.clear()
+            self.vector_overlay = None
+        if self.overlay_backend == "vector":
+            self.vector_overlay = VectorTrajectoryOverlay(self.graphics_scene, self.trajectory_manager, self.color_generator)
+
+        if hasattr(self, "decode_worker"):
+            self.decode_worker.stop()
+
+        window = prefetch_window(PREFETCH_WINDOW, self.frame_cache.max_bytes, self.video_width * self.video_height * 3)
+        self.decode_worker = DecodeWorker(self.playback_path, self.frame_cache, self.total_frames, window = window, index = self.video_index)
+        QApplication.instance().aboutToQuit.connect(self.decode_worker.stop)
+        self.decode_worker.start()
+
+        self.update_trajectory_overlay(np.zeros((self.video_height, self.video_width, 3), dtype = np.uint8))
         self.show_frame_at(0)
 
     def update_frame(self):
@@ -118,20 +220,25 @@ class VideoPlayer(QWidget):
             self.timer.stop()
             return
 
-        current_frame = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        # THE DISPLAYED FRAME, THE DECODER MAY ALREADY BE PAST IT
+        current_frame = self.current_frame
 
         if self.playback_mode == PlaybackMode.PLAYING:
-            new_frame = min(self.total_frames - 1, current_frame + self.playback_speed)
+            step = self.playback_speed
         elif self.playback_mode == PlaybackMode.REWINDING:
-            new_frame = max(0, current_frame - self.playback_speed)
+            step = -self.playback_speed
         elif self.playback_mode == PlaybackMode.FORWARDING:
-            new_frame = min(self.total_frames - 1, current_frame + (self.playback_speed * 2))
+            step = self.playback_speed * 2
         else:
             self.timer.stop()
             return
+        new_frame = max(0, min(self.total_frames - 1, current_frame + step))
+
+        # THE DECODE WORKER FILLS THE CACHE AHEAD, SO THE NEXT TICKS ONLY CONVERT AND DISPLAY
+        self.decode_worker.request(new_frame, step)
+        self.playback_step = step
 
         self.current_frame = new_frame
-        self.view.current_frame = self.current_frame 
         self.show_frame_at(new_frame)
 
         # STOP IF AT BOUNDARIES
@@ -142,57 +249,109 @@ class VideoPlayer(QWidget):
 
     def show_frame_at(self, frame_number):
         """Displays the frame at a given position using caching"""
+        self.current_frame = frame_number
+        self.view.current_frame = frame_number
         self.video_controls.current_frame_label.setText(str(frame_number))
         self.video_controls.frame_slider.setValue(frame_number)
-        self.trajectory_worker.update_frame(frame_number)
-
-        if frame_number in self.frame_cache and self.frame_cache[frame_number] is not None:
-            frame = self.frame_cache[frame_number]
+        if self.vector_overlay is not None:
+            self.vector_overlay.update(frame_number)
         else:
+            # ON A MISS THE FRAME KEEPS THE PREVIOUS OVERLAY UNTIL THE WORKER EMITS THE NEW ONE
+            overlay = self.trajectory_worker.request(frame_number, self.playback_step)
+            if overlay is not None:
+                self.update_trajectory_overlay(overlay)
+
+        frame = self.frame_cache.get(frame_number)
+        if frame is None:
             if self.cap and self.cap.isOpened():
-                self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number) 
-                ret, frame = self.cap.read()
+                frame = self.frame_reader.read(frame_number)
 
-                if ret and frame is not None:
-                    self.frame_cache[frame_number] = frame  
+                if frame is not None:
+                    self.frame_cache.put(frame_number, frame)
                 else:
                     log_warning(f"Failed to read frame {frame_number}")
                     return
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
 
         if frame is not None:
             self.display_frame(frame)
         else:
             log_warning(f"Frame {frame_number} is None. Video might be corrupted or out of range.")
 
-    def update_trajectory_overlay(self, overlay):
-        self.trajectory_overlay = np.copy(overlay)
-        log_info(f"[DEBUG] After updating, trajectory_overlay np.sum: {np.sum(self.trajectory_overlay)}")
+    def log_cache_stats(self):
+        stats = self.frame_cache.stats()
+        if stats["hits"] + stats["misses"] == 0:
+            return
+        log_info(
+            f"[PERF] Frame cache: {stats['frames']} frames, {stats['bytes'] / 1024 ** 2:.0f}/{stats['max_bytes'] / 1024 ** 2:.0f} MB | "
+            f"Hits: {stats['hits']} | Misses: {stats['misses']} | Evictions: {stats['evictions']} | Hit rate: {stats['hit_rate']:.1%}"
+        )
+        log_info(f"[PERF] Frame reader: {self.frame_reader.sequential_reads} sequential reads | {self.frame_reader.seeks} seeks | {self.frame_reader.corrections} corrected seeks | {self.decode_worker.decoded} prefetched")
+
+        if hasattr(self, "trajectory_worker"):
+            overlay = self.trajectory_worker.overlay_cache.stats()
+            log_info(
+                f"[PERF] Overlay cache: {overlay['frames']} overlays, {overlay['bytes'] / 1024 ** 2:.0f}/{overlay['max_bytes'] / 1024 ** 2:.0f} MB | "
+                f"Hits: {overlay['hits']} | Misses: {overlay['misses']} | Evictions: {overlay['evictions']} | Invalidations: {overlay['invalidations']} | Hit rate: {overlay['hit_rate']:.1%} | Layer rebuilds: {self.trajectory_worker.rebuilds}"
+            )
+
+        render = self.render_stats
+        if render["frames"]:
+            log_info(f"[PERF] Display: {render['frames']} frames | Avg: {render['total_ms'] / render['frames']:.2f} ms | Max: {render['max_ms']:.2f} ms | Buffer allocations: {render['allocations']}")
+
+    def update_trajectory_overlay(self, overlay, frame_number = None):
+        """Sets the overlay blended onto the frames.
+
+        Overlays emitted by the worker carry their frame number. They are
+        dropped if another frame is shown by now, otherwise the shown frame is
+        displayed again with them.
+        """
+        if frame_number is not None and frame_number != self.current_frame:
+            return
 
+        # THE WORKER NEVER CHANGES AN OVERLAY AFTER EMITTING IT, NO COPY NEEDED
+        self.trajectory_overlay = overlay
+        self.overlay_rect = overlay_bounds(overlay)
         self.view.trajectory_overlay = self.trajectory_overlay
 
+        if frame_number is not None and self.shown_frame is not None:
+            self.display_frame(self.shown_frame)
+
     def display_frame(self, frame, overlay = None):
-        """Converts the OpenCV frame to a QPixmap and displays it."""
+        """Blends the overlay onto the frame and displays it.
+
+        The frame stays BGR (QImage.Format_BGR888) and is copied once into a
+        reused display buffer, then the overlay is added only inside its non-zero
+        bounding rect. Without overlay pixels the QImage wraps the frame itself.
+        """
         if frame is None:
             log_warning("display_frame() received None frame. Skipping frame update.")
             return 
+        self.shown_frame = frame
 
         try:
-            # start_time = time.time()
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            start_time = time.perf_counter()
 
             if overlay is None:
-                overlay = self.trajectory_overlay
-
-            lastest_overlay = np.copy(overlay)
-            overlayed_frame = cv2.addWeighted(frame, 1, lastest_overlay, 1.0, 0)
-
-            log_info(f"[DEBUG] After blending, overlayed_frame np.sum: {np.sum(overlayed_frame)}")
-
-            height, width, _ = overlayed_frame.shape
-            bytes_per_line = 3 * width
-
-            image = QImage(overlayed_frame.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
+                overlay, overlay_rect = self.trajectory_overlay, self.overlay_rect
+            else:
+                overlay_rect = overlay_bounds(overlay)
+
+            height, width, _ = frame.shape
+            if overlay_rect is None or overlay.shape != frame.shape:
+                shown = np.ascontiguousarray(frame)
+            else:
+                if self.display_buffer is None or self.display_buffer.shape != frame.shape:
+                    self.display_buffer = np.empty_like(frame)
+                    self.render_stats["allocations"] += 1
+                shown = self.display_buffer
+                np.copyto(shown, frame)
+
+                # OVERLAY COLORS ARE RGB, ADD THEM CHANNEL-SWAPPED ONTO THE BGR FRAME (SATURATING, AS addWeighted DID)
+                x1, y1, x2, y2 = overlay_rect
+                region = shown[y1:y2, x1:x2]
+                cv2.add(region, np.ascontiguousarray(overlay[y1:y2, x1:x2, ::-1]), dst = region)
+
+            image = QImage(shown.data, width, height, shown.strides[0], QImage.Format.Format_BGR888)
             pixmap = QPixmap.fromImage(image)
 
             if pixmap.isNull():
@@ -200,13 +359,15 @@ class VideoPlayer(QWidget):
                 return
 
             self.pixmap_item.setPixmap(pixmap)
-            log_info(f"[DEBUG] Updating display with overlay sum: {np.sum(self.trajectory_overlay)}")
-            self.graphics_scene.setSceneRect(0, 0, pixmap.width(), pixmap.height())
-            self.view.fitInView(self.pixmap_item, Qt.AspectRatioMode.KeepAspectRatio)
-
-            # end_time = time.time()
-            # render_time = (end_time - start_time) * 1000  
-            # log_info(f"[PERF] Frame rendered in {render_time:.2f} ms")
+            if self.displayed_size != (width, height):
+                self.displayed_size = (width, height)
+                self.graphics_scene.setSceneRect(0, 0, width, height)
+                self.view.fitInView(self.pixmap_item, Qt.AspectRatioMode.KeepAspectRatio)
+
+            render_ms = (time.perf_counter() - start_time) * 1000
+            self.render_stats["frames"] += 1
+            self.render_stats["total_ms"] += render_ms
+            self.render_stats["max_ms"] = max(self.render_stats["max_ms"], render_ms)
         except Exception as e:
             log_error(f"Error in display_frame: {e}")
 
@@ -226,16 +387,18 @@ class VideoPlayer(QWidget):
         """Stops the video and resets to the first frame."""
         self.timer.stop()
         self.playback_mode = PlaybackMode.STOPPED
+        self.playback_step = 1
         if self.cap:
             self.cap.release()
-            self.cap = cv2.VideoCapture(self.video_path)
+            self.cap = cv2.VideoCapture(self.playback_path)
+            self.frame_reader = FrameReader(self.cap, index = self.video_index)
             if self.cap.isOpened():
                 self.show_frame_at(0)
     
         if hasattr(self, "trajectory_worker"):
             self.trajectory_worker.overlay_cache.clear()
         
-        self.trajectory_overlay = np.zeros((self.video_height, self.video_width, 3), dtype = np.uint8)
+        self.update_trajectory_overlay(np.zeros((self.video_height, self.video_width, 3), dtype = np.uint8))
         self.display_frame(self.frame_cache.get(0))  
 
     def play(self, speed = 2):
@@ -246,6 +409,7 @@ class VideoPlayer(QWidget):
         """Pauses playback."""
         self.timer.stop()
         self.playback_mode = PlaybackMode.STOPPED
+        self.playback_step = 1
 
     def rewind(self, speed = 2):
         """Starts rewinding at the given speed."""